@@ -1,12 +1,25 @@
 from pathlib import Path
 import os
-import sqlite3
 import json
+import bisect
 import re
+import copy
 import hashlib
+import queue
 import secrets
+import tempfile
+import threading
+import time
+from contextlib import closing
+from functools import wraps
 from datetime import datetime
 
+# A drop-in pysqlite3 build (e.g. SQLite compiled with PGO/LTO) is used when installed
+try:
+    import pysqlite3 as sqlite3
+except ImportError:
+    import sqlite3
+
 from flask import (
     Flask,
     render_template,
@@ -17,24 +30,50 @@ from flask import (
     session,
     jsonify,
     send_from_directory,
+    g,
+    has_app_context,
+    make_response,
 )
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-import pdfplumber
+import numpy as np
 import pandas as pd
 import google.generativeai as genai
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
 # Import optimized utilities for verified score pipeline
-from utils.parse_cibil_report import parse_cibil_report as parse_cibil_report_optimized
-from utils.parse_bank_statement import parse_bank_statement as parse_bank_statement_optimized
-from utils.parse_upi_statement import parse_upi_csv as parse_upi_csv_optimized, parse_upi_pdf as parse_upi_pdf_optimized
-from utils.parse_salary_slip import parse_salary_slip as parse_salary_slip_optimized
+from utils.parse_upi_statement import lowercase_columns, match_columns, read_upi_csv
+from utils.parse_pool import parse_documents
+from utils.pdf_text import iter_pdf_page_texts
+from utils.json_codec import dumps as dump_json, loads as load_json
 from utils.build_verified_dataset import build_verified_dataset, validate_dataset
-from utils.gemini_processor import call_gemini_pro_for_scoring
-from utils.cache_manager import hash_documents, check_cache, save_verified_score
+from utils.gemini_processor import (
+    FALLBACK_SCORE,
+    GEMINI_MODEL_NAME as SCORING_MODEL_NAME,
+    build_scoring_prompt,
+    call_gemini_pro_for_scoring,
+    get_fallback_score,
+    parse_llm_json,
+)
+from utils.llm_throttle import generate_content
+from utils.cache_manager import (
+    combine_document_hashes,
+    hash_documents,
+    save_and_hash,
+    check_cache,
+    find_parsed_documents,
+    save_verified_score,
+    hash_prompt,
+    get_cached_llm_response,
+    save_llm_response,
+    hash_stream,
+    get_cached_upi_parse,
+    save_upi_parse,
+)
 from utils.risk_engine import compute_risk_tier
 from utils.interest_rate_engine import recommend_interest_rate_range
 from utils.affordability_engine import estimate_affordability
@@ -57,6 +96,10 @@ def _month_key(ts: str) -> str:
 # Load environment variables from .env file
 load_dotenv()
 
+# utils.parse_pool's spawn workers re-run this file as __mp_main__ (python app.py is the main module).
+# They only parse documents, so they skip the one-off setup below: schema migrations and the KDF warm-up
+IN_PARSE_WORKER = __name__ == "__mp_main__"
+
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "auth.db"
 UPLOAD_FOLDER = BASE_DIR / "uploads"
@@ -69,23 +112,422 @@ if GEMINI_API_KEY:
 else:
     raise ValueError("GEMINI_API_KEY environment variable is not set. Please create a .env file with your API key.")
 
+# Gemini models - built once per process instead of on every request. All models share the
+# SDK's process-wide API client, so the TLS/gRPC channel is set up once and reused.
+# Responses are requested as JSON so they parse directly instead of being scraped from prose.
+GEMINI_MODEL_NAME = "gemini-2.5-flash"
+GEMINI_JSON_CONFIG = {"response_mime_type": "application/json"}
+gemini_model = genai.GenerativeModel(GEMINI_MODEL_NAME, generation_config=GEMINI_JSON_CONFIG)
+
+# Quick Score rubric - sent once as the system instruction so each request only carries the user data
+QUICK_SCORE_INSTRUCTION = """You are a financial behavior analyst. The user message is a JSON object of self-reported user data
+(monthly income, income stability, expenses, savings, emergency fund, bill payments, missed payments,
+UPI usage, digital vs cash, expense tracking, overspending, sudden big expenses) plus parsed UPI statement data.
+
+Calculate the following scores (each on a scale of 0-10):
+1. income_stability_score
+2. spending_discipline_score
+3. savings_behavior_score
+4. payment_discipline_score
+5. digital_behavior_score
+6. lifestyle_stability_score
+
+Then calculate a final behavior_score (0-10) as a weighted average:
+- income_stability: 15%
+- spending_discipline: 20%
+- savings_behavior: 20%
+- payment_discipline: 25%
+- digital_behavior: 10%
+- lifestyle_stability: 10%
+
+Respond ONLY with valid JSON in this exact format:
+{
+  "income_stability_score": <number 0-10>,
+  "spending_discipline_score": <number 0-10>,
+  "savings_behavior_score": <number 0-10>,
+  "payment_discipline_score": <number 0-10>,
+  "digital_behavior_score": <number 0-10>,
+  "lifestyle_stability_score": <number 0-10>,
+  "behavior_score": <number 0-10>,
+  "explanation": "<3-4 bullet points explaining the score>",
+  "key_insights": {
+    "positive": ["<what increased score>", "<another positive>"],
+    "negative": ["<what reduced score>", "<another negative>"]
+  },
+  "improvement_tips": ["<tip 1>", "<tip 2>", "<tip 3>", "<tip 4>"]
+}
+"""
+quick_score_model = genai.GenerativeModel(
+    GEMINI_MODEL_NAME,
+    system_instruction=QUICK_SCORE_INSTRUCTION,
+    generation_config=GEMINI_JSON_CONFIG,
+)
+# Cache key namespace - changes whenever the model or the rubric changes
+QUICK_SCORE_CACHE_MODEL = f"{GEMINI_MODEL_NAME}:{hashlib.sha256(QUICK_SCORE_INSTRUCTION.encode()).hexdigest()[:12]}"
+
+# LLM response cache mode:
+# - enabled: read cached responses, store new ones
+# - read-only: read cached responses, never store
+# - replay: read cached responses, never call the API (misses use default scores)
+# - disabled: always call the API
+LLM_CACHE_MODES = {"enabled", "read-only", "replay", "disabled"}
+LLM_CACHE_MODE = os.environ.get("LLM_CACHE_MODE", "enabled").strip().lower()
+if LLM_CACHE_MODE not in LLM_CACHE_MODES:
+    raise ValueError(f"LLM_CACHE_MODE must be one of {sorted(LLM_CACHE_MODES)}, got '{LLM_CACHE_MODE}'.")
+
+# Shown to users when the LLM call fails; the exception itself is only logged server-side
+LLM_ERROR_EXPLANATION = "AI analysis is temporarily unavailable. Using default scores."
+
+# Fallback behavioral score (the explanation is filled in per call site)
+DEFAULT_BEHAVIOR_SCORE = {
+    "income_stability_score": 7.0,
+    "spending_discipline_score": 7.0,
+    "savings_behavior_score": 7.0,
+    "payment_discipline_score": 7.0,
+    "digital_behavior_score": 7.0,
+    "lifestyle_stability_score": 7.0,
+    "behavior_score": 7.0,
+    "explanation": "",
+    "key_insights": {"positive": [], "negative": []},
+    "improvement_tips": ["Maintain consistent savings", "Pay bills on time", "Track expenses regularly"]
+}
+
+# Password KDF - scrypt cost parameters (N:r:p) trade signin latency for brute-force cost;
+# existing hashes keep verifying after a change because the method is stored in each hash
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+# Checked when no account matches the email, so unknown emails cost the same KDF time as wrong passwords
+DUMMY_PASSWORD_HASH = (None if IN_PARSE_WORKER
+                       else generate_password_hash(secrets.token_urlsafe(16), method=PASSWORD_HASH_METHOD))
+
 ALLOWED_EXTENSIONS = {'pdf', 'csv'}
+ALLOWED_SUFFIXES = tuple(f'.{ext}' for ext in ALLOWED_EXTENSIONS)  # for str.endswith
 
 # Loan types
-LOAN_TYPES = ['personal', 'home', 'education', 'business', 'vehicle', 'gold', 'other']
+LOAN_TYPES = ('personal', 'home', 'education', 'business', 'vehicle', 'gold', 'other')
+
+# Loan-type-specific risk weights: (cibil_weight, behavior_weight)
+LOAN_TYPE_RISK_WEIGHTS = {
+    'personal': (0.5, 0.5),
+    'home': (0.6, 0.4),
+    'education': (0.4, 0.6),
+    'business': (0.45, 0.55),
+    'vehicle': (0.5, 0.5),
+    'gold': (0.3, 0.7),
+    'other': (0.5, 0.5),
+}
+# Loan risk tiers: (risk level, recommendation) for adjusted scores below 550, from 550, from 650 and from 750
+LOAN_RISK_THRESHOLDS = (550, 650, 750)
+LOAN_RISK_LEVELS = (
+    ("High", "Reject"),
+    ("Medium-High", "Caution / Need more documents"),
+    ("Medium", "Approve with Caution"),
+    ("Low", "Approve"),
+)
+
+# Quick Score parser patterns - compiled once at import, not per request
+CIBIL_SCORE_RE = re.compile(r'(?:CIBIL|credit\s*score|score)[\s:]*(\d{3})', re.IGNORECASE)
+LATE_PAYMENT_RE = re.compile(r'(?:late|delayed|overdue|missed).*?payment', re.IGNORECASE)
+UTILIZATION_RE = re.compile(r'(\d+(?:\.\d+)?)\s*%')
+UPI_AMOUNT_RE = re.compile(r'₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)')
+LOAN_KEYWORD_RE = re.compile(r'loan|credit card|mortgage|emi', re.IGNORECASE)
+# One alternation per keyword category, so a single scan counts every category
+UPI_KEYWORD_RE = re.compile(
+    r'(?P<transaction>upi|payment|transfer|debit|credit)'
+    r'|(?P<bill>bill|electricity|water|gas|phone|recharge)',
+    re.IGNORECASE,
+)
+EMI_KEYWORD_RE = re.compile(r'(?P<emi>emi|loan|installment|repayment)', re.IGNORECASE)
+NEGATIVE_BALANCE_RE = re.compile(r'overdraft|negative|insufficient', re.IGNORECASE)
+BANK_BALANCE_RES = [
+    re.compile(r'(?:balance|bal|available)[\s:]*₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)', re.IGNORECASE),
+    re.compile(r'₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:balance|bal)', re.IGNORECASE),
+]
+BANK_DEBIT_RE = re.compile(r'(?:debit|withdrawal|payment)[\s:]*₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)', re.IGNORECASE)
+BANK_CREDIT_RE = re.compile(r'(?:credit|deposit|salary)[\s:]*₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)', re.IGNORECASE)
+SALARY_RES = [
+    re.compile(r'(?:gross|salary|net\s*pay|total)[\s:]*₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)', re.IGNORECASE),
+    re.compile(r'₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:gross|salary|net)', re.IGNORECASE),
+]
+SALARY_DEDUCTION_RE = re.compile(r'(?:deduction|pf|tax|tds)[\s:]*₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)', re.IGNORECASE)
+SALARY_EMP_ID_RE = re.compile(r'(?:employee\s*id|emp\s*id|id)[\s:]*([A-Z0-9]+)', re.IGNORECASE)
+SALARY_MONTH_RE = re.compile(r'(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\w*\s*\d{4}', re.IGNORECASE)
+UPI_CSV_BILL_PATTERN = "|".join(map(re.escape, ['bill', 'electricity', 'water', 'gas', 'phone', 'internet', 'recharge']))
 
 # UltraMSG WhatsApp API Configuration - Load from environment variables
 ULTRAMSG_INSTANCE_ID = os.environ.get("ULTRAMSG_INSTANCE_ID", "")
 ULTRAMSG_TOKEN = os.environ.get("ULTRAMSG_TOKEN", "")
 ULTRAMSG_API_URL = f"https://api.ultramsg.com/{ULTRAMSG_INSTANCE_ID}/" if ULTRAMSG_INSTANCE_ID else ""
-
-def get_db(app: Flask) -> sqlite3.Connection:
-    conn = sqlite3.connect(app.config["DATABASE"])
+# UltraMSG API endpoint format: https://api.ultramsg.com/{instance}/messages/chat
+ULTRAMSG_CHAT_URL = f"https://api.ultramsg.com/{ULTRAMSG_INSTANCE_ID}/messages/chat"
+REMINDER_INTERVAL_DAYS = 30
+REMINDER_MESSAGE = "🔔 InsightScore Reminder: It's been a while since you checked your credit score. Generate your monthly Quick InsightScore to track your financial health! Visit your dashboard to get started."
+PHONE_STRIP_TABLE = str.maketrans("", "", "+ -")
+
+# Shared HTTP session - keeps TCP/TLS connections to UltraMSG alive between messages.
+# Retries cover connection errors; POSTs are not re-sent on 5xx so a message is never delivered twice.
+whatsapp_session = requests.Session()
+whatsapp_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504)),
+)
+whatsapp_session.mount("https://", whatsapp_adapter)
+whatsapp_session.mount("http://", whatsapp_adapter)
+
+# Outgoing WhatsApp messages queued from requests, sent by a background thread
+whatsapp_queue = queue.Queue()
+whatsapp_sender = None
+whatsapp_sender_lock = threading.Lock()
+
+# SQLite connection pool - idle connections are reused across requests
+DB_POOL_SIZE = 8
+DB_BUSY_TIMEOUT_MS = 5000
+# Prepared statements kept per pooled connection - room for every distinct statement the app runs
+DB_CACHED_STATEMENTS = 256
+# Phone numbers for users that signed up before the phone column existed:
+# (phone, username pattern, reversed username pattern)
+KNOWN_USER_PHONES = [
+    ('9930235462', '%parth%mahadik%', '%mahadik%parth%'),
+    ('9076370678', '%vini%sawant%', '%sawant%vini%'),
+]
+BACKFILL_PHONE_SQL = "UPDATE users SET phone = ? WHERE LOWER(username) LIKE ? OR LOWER(username) LIKE ?"
+
+# Stored in PRAGMA user_version; bump whenever init_db creates or migrates anything new
+SCHEMA_VERSION = 7
+DB_MMAP_SIZE = 256 * 1024 * 1024  # reads are served from the OS page cache up to this size
+DB_WAL_SIZE_LIMIT = 64 * 1024 * 1024
+_db_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+# Hot-path SQL - identical statement text lets each pooled connection reuse its prepared statement
+SELECT_USER_BY_EMAIL_SQL = "SELECT id, unique_user_id, username, email, password_hash FROM users WHERE email = ?"
+SELECT_LENDER_BY_EMAIL_SQL = "SELECT id, unique_lender_id, name, email, password_hash, org_name FROM lenders WHERE email = ?"
+INSERT_USER_SQL = """INSERT INTO users (unique_user_id, username, email, password_hash, role, phone)
+                     VALUES (?, ?, ?, ?, ?, ?) RETURNING id"""
+INSERT_LENDER_SQL = """INSERT INTO lenders (unique_lender_id, name, email, password_hash, org_name, role)
+                       VALUES (?, ?, ?, ?, ?, ?) RETURNING id"""
+# Loan types a lender offers - one row each, read back as a plain list
+LENDER_LOAN_TYPES_SQL = "SELECT loan_type FROM lender_loan_types WHERE lender_id = ?"
+INSERT_LENDER_LOAN_TYPE_SQL = "INSERT OR IGNORE INTO lender_loan_types (lender_id, loan_type) VALUES (?, ?)"
+# Drops the loan types missing from a JSON array of the lender's new set
+DELETE_OTHER_LENDER_LOAN_TYPES_SQL = """DELETE FROM lender_loan_types
+    WHERE lender_id = ? AND loan_type NOT IN (SELECT value FROM json_each(?))"""
+# Lender loan types change rarely; each process caches them per lender for this many seconds
+LENDER_LOAN_TYPES_CACHE_TTL = 60
+LENDER_LOAN_TYPES_CACHE_SIZE = 1024
+_lender_loan_types_cache = {}  # lender_id -> (expires_at monotonic time, loan types tuple)
+# Random public IDs are checked by their UNIQUE index on insert; a collision re-rolls the ID this many times
+UNIQUE_ID_ATTEMPTS = 3
+# SQL equivalent of generate_unique_user_id() for set-based backfills
+RANDOM_USER_ID_SQL = "'USR-' || hex(randomblob(4))"
+# Users with a phone number and their latest quick score (served by idx_quick_scores_user_created)
+REMINDER_CANDIDATES_SQL = """SELECT u.id, u.phone, MAX(q.created_at) AS last_score_at
+    FROM users u LEFT JOIN quick_scores q ON q.user_id = u.id
+    WHERE u.phone IS NOT NULL AND u.phone != ''"""
+# Dashboard: the user's ID, phone and unread notification count in one round trip
+DASHBOARD_USER_SQL = """SELECT unique_user_id, phone,
+           (SELECT COUNT(*) FROM notifications n WHERE n.user_id = users.id AND n.is_read = 0) AS unread_count
+    FROM users WHERE id = ?"""
+# Dashboard: quick score history (last 6) - only the latest row carries its behavior_json
+DASHBOARD_QUICK_SCORES_SQL = """SELECT hybrid_score, created_at,
+           CASE WHEN ROW_NUMBER() OVER (ORDER BY created_at DESC) = 1 THEN behavior_json END AS behavior_json
+    FROM quick_scores WHERE user_id = ? ORDER BY created_at DESC LIMIT 6"""
+INSERT_QUICK_SCORE_SQL = "INSERT INTO quick_scores (user_id, behavior_json, hybrid_score) VALUES (?, ?, ?)"
+# Lender search / score views
+USER_WITH_PENDING_LOAN_SQL = """SELECT u.id, u.username, u.unique_user_id, u.phone, lr.loan_type, lr.id AS request_id
+    FROM users u
+    LEFT JOIN loan_requests lr ON lr.user_id = u.id AND lr.status = 'pending'
+    WHERE u.unique_user_id = ?
+    ORDER BY lr.created_at DESC LIMIT 1"""
+# Lender score view: the user, their latest pending request, an explicitly linked request (NULL id = none),
+# the viewing lender and the user's latest verified score, all in one statement
+LENDER_SCORE_VIEW_SQL = """SELECT u.id, u.username, u.unique_user_id, u.phone,
+           p.loan_type AS pending_loan_type, p.id AS pending_request_id,
+           r.id AS linked_request_id, r.loan_type AS linked_loan_type,
+           l.name AS lender_name, l.org_name AS lender_org_name,
+           vs.id AS score_id, vs.hybrid_score, vs.risk_tier, vs.created_at AS score_created_at,
+           vs.cibil_json, vs.bank_json, vs.upi_json, vs.salary_json, vs.behavior_json,
+           vs.affordability_json, vs.interest_rate_json, vs.improvement_plan_json
+    FROM users u
+    LEFT JOIN loan_requests p ON p.id = (SELECT id FROM loan_requests
+        WHERE user_id = u.id AND status = 'pending' ORDER BY created_at DESC LIMIT 1)
+    LEFT JOIN loan_requests r ON r.id = ?
+    LEFT JOIN lenders l ON l.id = ?
+    LEFT JOIN verified_scores vs ON vs.id = (SELECT id FROM verified_scores
+        WHERE user_id = u.id ORDER BY created_at DESC LIMIT 1)
+    WHERE u.unique_user_id = ?"""
+VERIFIED_SCORE_VIEW_COLUMNS = ("hybrid_score", "risk_tier", "cibil_json", "bank_json", "upi_json", "salary_json",
+                               "behavior_json", "affordability_json", "interest_rate_json", "improvement_plan_json")
+# One row per notification - pass a list of rows to executemany to notify several users at once
+INSERT_NOTIFICATION_SQL = """INSERT INTO notifications (user_id, lender_id, notification_type, message)
+    VALUES (?, ?, ?, ?)"""
+# decision_json is built by SQLite; decided_at is UTC, like the CURRENT_TIMESTAMP columns
+DECIDE_LOAN_REQUEST_SQL = """UPDATE loan_requests SET lender_id = ?, status = ?,
+        decision_json = json_object('decision', ?, 'notes', ?, 'lender_id', ?,
+                                    'decided_at', strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
+    WHERE id = ?
+    RETURNING loan_type"""
+# The ids arrive as one JSON array, so any batch size runs the same cached statement
+MARK_NOTIFICATIONS_READ_SQL = """UPDATE notifications SET is_read = 1
+    WHERE user_id = ? AND is_read = 0 AND id IN (SELECT value FROM json_each(?))"""
+MAX_MARK_READ_BATCH = 100
+# Abandoned flows: pending rows older than PENDING_MAX_AGE_HOURS are purged by `flask purge-pending`
+PENDING_MAX_AGE_HOURS = 24
+STALE_PENDING_UPLOADS_SQL = """SELECT payload FROM pending
+    WHERE kind = 'verified_files' AND created_at < datetime('now', ?)"""
+DELETE_STALE_PENDING_SQL = "DELETE FROM pending WHERE created_at < datetime('now', ?)"
+# Parsed UPI statements are reused for this long, then purged by the same command
+UPI_PARSE_CACHE_MAX_AGE_DAYS = 7
+DELETE_STALE_UPI_PARSES_SQL = "DELETE FROM upi_parse_cache WHERE created_at < datetime('now', ?)"
+
+def _connect_db(database: str) -> sqlite3.Connection:
+    # Pooled connections move between request threads, but only one uses it at a time
+    # Autocommit (isolation_level=None): a lone write statement is its own transaction, without the
+    # module's implicit BEGIN and a separate COMMIT. Multi-statement writes open one with BEGIN IMMEDIATE
+    conn = sqlite3.connect(database, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           cached_statements=DB_CACHED_STATEMENTS, isolation_level=None)
     conn.row_factory = sqlite3.Row
-    # Enable auto-commit for context manager
     conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    # Safe with WAL: only the last transactions can be lost on power failure, never corrupted
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -20000")  # ~20MB page cache
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    # Checkpoints shrink the -wal file back to this size instead of leaving it at its high-water mark
+    conn.execute(f"PRAGMA journal_size_limit = {DB_WAL_SIZE_LIMIT}")
     return conn
 
+def get_db(app: Flask) -> sqlite3.Connection:
+    """
+    Return the request's pooled connection, shared by every get_db call in the request
+    and returned to the pool at teardown. Outside an app context a fresh connection is
+    returned and the caller must close it.
+    """
+    if not has_app_context():
+        return _connect_db(app.config["DATABASE"])
+    conn = g.get("db")
+    if conn is None:
+        try:
+            conn = _db_pool.get_nowait()
+        except queue.Empty:
+            conn = _connect_db(app.config["DATABASE"])
+        g.db = conn
+    return conn
+
+def release_db(exception=None) -> None:
+    """Return the request's connection to the pool at app-context teardown"""
+    conn = g.pop("db", None)
+    if conn is None:
+        return
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _db_pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+def form_text(name):
+    """Stripped text value of a form field ('' when missing)"""
+    return request.form.get(name, "").strip()
+
+def form_email():
+    """Email form field, normalized for lookups (ASCII addresses take str.lower's fast path)"""
+    return form_text("email").lower()
+
+def require_role(role, api=False):
+    """
+    Route decorator: only a signed-in account of the given role ('user' or 'lender') gets through.
+    Others are sent to sign in (or get a 401 JSON error for api routes).
+    The account's row id is left in g.actor_id for the handler.
+    """
+    id_key = f"{role}_id"
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            current = session._get_current_object()
+            if id_key not in current or current.get("role") != role:
+                if api:
+                    return jsonify({"error": "Unauthorized"}), 401
+                return redirect(url_for("signin"))
+            g.actor_id = current[id_key]
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def password_matches(account, password):
+    """
+    Check password against an account row's password_hash (False if account is None).
+    Missing accounts still run the KDF, so response time does not reveal which emails exist.
+    """
+    if account is None:
+        check_password_hash(DUMMY_PASSWORD_HASH, password)
+        return False
+    return check_password_hash(account["password_hash"], password)
+
+def set_lender_loan_types(conn, lender_id, loan_types):
+    """
+    Replace the loan types a lender offers.
+    Only the difference is written: dropped types are deleted, new ones inserted, kept ones left alone.
+    """
+    conn.execute(DELETE_OTHER_LENDER_LOAN_TYPES_SQL, (lender_id, dump_json(list(loan_types))))
+    conn.executemany(INSERT_LENDER_LOAN_TYPE_SQL, [(lender_id, loan_type) for loan_type in loan_types])
+
+def get_lender_loan_types(conn, lender_id):
+    """Loan types a lender offers"""
+    return [row["loan_type"] for row in conn.execute(LENDER_LOAN_TYPES_SQL, (lender_id,))]
+
+def cached_lender_loan_types(conn, lender_id):
+    """
+    Loan types a lender offers, from a short-lived per-process cache.
+    Edits in this process drop the entry at once; other worker processes see them within the TTL.
+    """
+    entry = _lender_loan_types_cache.get(lender_id)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    loan_types = tuple(get_lender_loan_types(conn, lender_id))
+    if len(_lender_loan_types_cache) >= LENDER_LOAN_TYPES_CACHE_SIZE:
+        _lender_loan_types_cache.clear()
+    _lender_loan_types_cache[lender_id] = (time.monotonic() + LENDER_LOAN_TYPES_CACHE_TTL, loan_types)
+    return loan_types
+
+def fetch_user_with_pending_loan(conn, unique_user_id):
+    """
+    Look up a user by public ID together with their latest pending loan request, in one query.
+    Returns a dict with id, username, unique_user_id, phone, loan_type and request_id (the last two
+    None without a pending request), or None if there is no such user.
+    """
+    row = conn.execute(USER_WITH_PENDING_LOAN_SQL, (unique_user_id,)).fetchone()
+    return dict(row) if row else None
+
+def fetch_lender_score_view(conn, unique_user_id, request_id, lender_id):
+    """
+    Everything the lender score pages need, from one query.
+    Returns (user, linked loan request or None, lender, latest verified score or None) as dicts,
+    or None if there is no such user. user has the same keys as fetch_user_with_pending_loan.
+    """
+    row = conn.execute(LENDER_SCORE_VIEW_SQL, (request_id, lender_id, unique_user_id)).fetchone()
+    if row is None:
+        return None
+    user = {
+        "id": row["id"],
+        "username": row["username"],
+        "unique_user_id": row["unique_user_id"],
+        "phone": row["phone"],
+        "loan_type": row["pending_loan_type"],
+        "request_id": row["pending_request_id"],
+    }
+    linked_request = None
+    if row["linked_request_id"] is not None:
+        linked_request = {"id": row["linked_request_id"], "loan_type": row["linked_loan_type"]}
+    lender = {"name": row["lender_name"], "org_name": row["lender_org_name"]}
+    verified_score = None
+    if row["score_id"] is not None:
+        verified_score = {column: row[column] for column in VERIFIED_SCORE_VIEW_COLUMNS}
+        verified_score["id"] = row["score_id"]
+        verified_score["created_at"] = row["score_created_at"]
+    return user, linked_request, lender, verified_score
+
 def generate_unique_user_id():
     """Generate unique user ID: USR-<random>"""
     random_part = secrets.token_hex(4).upper()
@@ -96,6 +538,22 @@ def generate_unique_lender_id():
     random_part = secrets.token_hex(4).upper()
     return f"LND-{random_part}"
 
+def insert_with_unique_id(conn, sql, generate_id, id_column, params):
+    """
+    Run an INSERT ... RETURNING id whose first parameter is a freshly generated public ID
+    and return (row id, public ID) without a follow-up SELECT.
+    The column's UNIQUE index rejects a collision, which re-rolls the ID (no pre-check SELECT).
+    Other integrity errors (e.g. a duplicate email) propagate to the caller.
+    """
+    for attempt in range(UNIQUE_ID_ATTEMPTS):
+        unique_id = generate_id()
+        try:
+            row = conn.execute(sql, (unique_id, *params)).fetchone()
+            return row["id"], unique_id
+        except sqlite3.IntegrityError as e:
+            if id_column not in str(e) or attempt == UNIQUE_ID_ATTEMPTS - 1:
+                raise
+
 def calculate_doc_hash(files_dict):
     """Calculate hash of uploaded documents for caching - uses file content hashing"""
     # Use optimized cache manager for file content hashing
@@ -105,20 +563,18 @@ def send_whatsapp_message(phone_number, message):
     """Send WhatsApp message via UltraMSG API"""
     try:
         # Format phone number (remove +, spaces, etc.)
-        phone = phone_number.replace("+", "").replace(" ", "").replace("-", "")
+        phone = phone_number.translate(PHONE_STRIP_TABLE)
         # Ensure it starts with country code (assuming India +91)
         if not phone.startswith("91") and len(phone) == 10:
             phone = "91" + phone
         
-        # UltraMSG API endpoint format: https://api.ultramsg.com/{instance}/messages/chat
-        url = f"https://api.ultramsg.com/{ULTRAMSG_INSTANCE_ID}/messages/chat"
         payload = {
             "token": ULTRAMSG_TOKEN,
             "to": phone,
             "body": message
         }
         
-        response = requests.post(url, data=payload, timeout=10)
+        response = whatsapp_session.post(ULTRAMSG_CHAT_URL, data=payload, timeout=10)
         if response.status_code == 200:
             result = response.json()
             if result.get("sent") == "true" or result.get("success") == True:
@@ -133,44 +589,85 @@ def send_whatsapp_message(phone_number, message):
         print(f"Error sending WhatsApp message: {str(e)}")
         return False
 
-def check_monthly_reminder(user_id, conn):
-    """Check if user needs monthly reminder to check score"""
+def _whatsapp_sender_loop():
+    while True:
+        phone_number, message = whatsapp_queue.get()
+        try:
+            send_whatsapp_message(phone_number, message)
+        finally:
+            whatsapp_queue.task_done()
+
+def queue_whatsapp_message(phone_number, message):
+    """
+    Queue a WhatsApp message and return immediately, so requests never wait on the UltraMSG API.
+    Messages are sent in order by one daemon thread, started on first use.
+    """
+    global whatsapp_sender
+    with whatsapp_sender_lock:
+        if whatsapp_sender is None:
+            whatsapp_sender = threading.Thread(target=_whatsapp_sender_loop, name="whatsapp-sender", daemon=True)
+            whatsapp_sender.start()
+    whatsapp_queue.put((phone_number, message))
+
+def _reminder_due(last_score_at, now=None):
+    """
+    True when a user has no quick score or the last one is at least REMINDER_INTERVAL_DAYS old.
+    Bulk callers pass one shared now instead of reading the clock per user.
+    """
+    if not last_score_at:
+        return True
+    last_date = datetime.fromisoformat(last_score_at.replace("Z", "+00:00") if "Z" in last_score_at else last_score_at)
+    return ((now or datetime.now()) - last_date.replace(tzinfo=None)).days >= REMINDER_INTERVAL_DAYS
+
+def send_reminder_if_due(phone, last_score_at):
+    """Queue the monthly reminder to phone when the last quick score (if any) is old enough"""
     try:
-        # Get user's phone number
-        cur = conn.execute("SELECT phone FROM users WHERE id = ?", (user_id,))
-        user = cur.fetchone()
-        if not user or not user["phone"]:
-            return False
-        
-        # Get last quick score
-        cur = conn.execute(
-            "SELECT created_at FROM quick_scores WHERE user_id = ? ORDER BY created_at DESC LIMIT 1",
-            (user_id,)
-        )
-        last_score = cur.fetchone()
-        
-        # If no score exists or last score is more than 30 days old, send reminder
-        should_remind = False
-        if not last_score:
-            should_remind = True
-        else:
-            last_date = datetime.fromisoformat(last_score["created_at"].replace("Z", "+00:00") if "Z" in last_score["created_at"] else last_score["created_at"])
-            days_since = (datetime.now() - last_date.replace(tzinfo=None)).days
-            if days_since >= 30:
-                should_remind = True
-        
-        if should_remind:
-            message = "🔔 InsightScore Reminder: It's been a while since you checked your credit score. Generate your monthly Quick InsightScore to track your financial health! Visit your dashboard to get started."
-            return send_whatsapp_message(user["phone"], message)
-        
+        if phone and _reminder_due(last_score_at):
+            queue_whatsapp_message(phone, REMINDER_MESSAGE)
+            return True
         return False
     except Exception as e:
         print(f"Error checking monthly reminder: {str(e)}")
         return False
 
+def check_monthly_reminders_bulk(conn):
+    """Send monthly reminders to every user who is due one; returns the number of messages sent"""
+    try:
+        users = conn.execute(f"{REMINDER_CANDIDATES_SQL} GROUP BY u.id").fetchall()
+    except Exception as e:
+        print(f"Error checking monthly reminders: {str(e)}")
+        return 0
+    
+    sent = 0
+    now = datetime.now()
+    for user in users:
+        if _reminder_due(user["last_score_at"], now) and send_whatsapp_message(user["phone"], REMINDER_MESSAGE):
+            sent += 1
+    return sent
+
+def has_unique_index(conn, table, column):
+    """True if a single-column UNIQUE index (or UNIQUE constraint) covers table.column"""
+    return conn.execute(
+        """SELECT 1 FROM pragma_index_list(?) AS il
+           WHERE il."unique" = 1
+             AND (SELECT COUNT(*) FROM pragma_index_info(il.name)) = 1
+             AND (SELECT name FROM pragma_index_info(il.name)) = ?""",
+        (table, column),
+    ).fetchone() is not None
+
 def init_db(app: Flask) -> None:
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with get_db(app) as conn:
+    # Runs at import, outside any app context, so the connection is not pooled - close it when done
+    with closing(get_db(app)) as conn, conn:
+        # Warm start: the schema is already current, skip table creation and migrations
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        
+        # WAL lets readers run alongside a writer; the mode is persisted in the database file
+        conn.execute("PRAGMA journal_mode = WAL")
+        # Everything below, DDL included, commits or rolls back as one transaction
+        conn.execute("BEGIN IMMEDIATE")
+        
         # Check if users table exists and get its columns
         cur = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
         table_exists = cur.fetchone() is not None
@@ -183,44 +680,36 @@ def init_db(app: Flask) -> None:
             # Add unique_user_id column if it doesn't exist
             if 'unique_user_id' not in columns:
                 conn.execute("ALTER TABLE users ADD COLUMN unique_user_id TEXT")
-                # Generate unique_user_id for existing users
-                cur = conn.execute("SELECT id FROM users WHERE unique_user_id IS NULL OR unique_user_id = ''")
-                existing_users = cur.fetchall()
-                for user_row in existing_users:
-                    unique_id = generate_unique_user_id()
-                    # Ensure uniqueness
-                    max_attempts = 10
-                    attempts = 0
-                    while attempts < max_attempts:
-                        check_cur = conn.execute("SELECT id FROM users WHERE unique_user_id = ?", (unique_id,))
-                        if check_cur.fetchone() is None:
-                            break
-                        unique_id = generate_unique_user_id()
-                        attempts += 1
-                    conn.execute("UPDATE users SET unique_user_id = ? WHERE id = ?", (unique_id, user_row[0]))
-                # Create unique index
-                try:
-                    conn.execute("CREATE UNIQUE INDEX idx_users_unique_user_id ON users(unique_user_id)")
-                except sqlite3.OperationalError:
-                    pass
-                conn.commit()
+                # Generate unique_user_id for all existing users in one statement
+                conn.execute(
+                    f"UPDATE users SET unique_user_id = {RANDOM_USER_ID_SQL} WHERE unique_user_id IS NULL OR unique_user_id = ''"
+                )
+            
+            # Signup relies on the database to reject duplicate IDs. Columns added by older signup code
+            # have no UNIQUE index yet: create it, re-rolling the (astronomically rare) duplicate IDs until it builds
+            if not has_unique_index(conn, "users", "unique_user_id"):
+                while True:
+                    try:
+                        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_unique_user_id ON users(unique_user_id)")
+                        break
+                    except sqlite3.IntegrityError:
+                        conn.execute(
+                            f"""UPDATE users SET unique_user_id = {RANDOM_USER_ID_SQL}
+                                WHERE id IN (SELECT MIN(id) FROM users GROUP BY unique_user_id HAVING COUNT(*) > 1)"""
+                        )
             
             # Add role column if it doesn't exist
             if 'role' not in columns:
                 conn.execute("ALTER TABLE users ADD COLUMN role TEXT DEFAULT 'user'")
                 # Set default role for existing users
                 conn.execute("UPDATE users SET role = 'user' WHERE role IS NULL")
-                conn.commit()
             
             # Add phone column if it doesn't exist
             if 'phone' not in columns:
                 conn.execute("ALTER TABLE users ADD COLUMN phone TEXT")
-                conn.commit()
                 
-                # Update existing users' phone numbers
-                conn.execute("UPDATE users SET phone = '9930235462' WHERE LOWER(username) LIKE '%parth%mahadik%' OR LOWER(username) LIKE '%mahadik%parth%'")
-                conn.execute("UPDATE users SET phone = '9076370678' WHERE LOWER(username) LIKE '%vini%sawant%' OR LOWER(username) LIKE '%sawant%vini%'")
-                conn.commit()
+                # Update existing users' phone numbers (one prepared statement for all of them)
+                conn.executemany(BACKFILL_PHONE_SQL, KNOWN_USER_PHONES)
         else:
             # Create users table with all columns
             conn.execute(
@@ -248,7 +737,7 @@ def init_db(app: Flask) -> None:
                 email TEXT NOT NULL UNIQUE,
                 password_hash TEXT NOT NULL,
                 org_name TEXT,
-                loan_types_offered TEXT,
+                loan_types_offered TEXT,  -- legacy JSON list, superseded by lender_loan_types
                 role TEXT DEFAULT 'lender',
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
@@ -338,6 +827,64 @@ def init_db(app: Flask) -> None:
             """
         )
         
+        # Create llm_cache table (Gemini responses keyed by prompt hash)
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                response_json TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        
+        # Parsed Quick Score UPI statements by "<csv|pdf>:<content SHA256>" - re-uploads skip parsing
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS upi_parse_cache (
+                key TEXT PRIMARY KEY,
+                parsed_json TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        
+        # Create pending table (transient per-user flow data; the session only keeps the row id)
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pending (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (user_id, kind),
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+            """
+        )
+        
+        # Loan types offered per lender (replaces the lenders.loan_types_offered JSON list)
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS lender_loan_types (
+                lender_id INTEGER NOT NULL,
+                loan_type TEXT NOT NULL,
+                PRIMARY KEY (lender_id, loan_type),
+                FOREIGN KEY (lender_id) REFERENCES lenders (id)
+            ) WITHOUT ROWID
+            """
+        )
+        # Backfill from the legacy column: a JSON list, or comma-separated in the oldest rows
+        legacy_loan_types = []
+        for lender_id, offered in conn.execute("SELECT id, loan_types_offered FROM lenders WHERE loan_types_offered != ''"):
+            try:
+                loan_types = load_json(offered)
+            except ValueError:
+                loan_types = [loan_type.strip() for loan_type in offered.split(",")]
+            legacy_loan_types.extend((lender_id, loan_type) for loan_type in loan_types if loan_type)
+        conn.executemany(INSERT_LENDER_LOAN_TYPE_SQL, legacy_loan_types)
+        
         # Keep old scores table for backward compatibility (will migrate data later)
         conn.execute(
             """
@@ -354,6 +901,49 @@ def init_db(app: Flask) -> None:
             """
         )
         
+        # Per-user score history indexes (latest-first); hybrid_score is included so
+        # dashboard/trend reads are answered from the index without touching the table
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_quick_scores_user_created ON quick_scores (user_id, created_at DESC, hybrid_score)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_scores_user_created ON scores (user_id, created_at DESC, hybrid_score)"
+        )
+        
+        # Verified score cache lookups by document hash - per user (check_cache) and, through the
+        # doc_hash prefix, across users (find_parsed_documents)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_verified_scores_doc_user ON verified_scores (doc_hash, user_id)"
+        )
+        # Latest verified score (dashboard, lender view) and the financial trends series
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_verified_scores_user_created ON verified_scores (user_id, created_at DESC)"
+        )
+        
+        # Unread notification counts and lender dashboard request lists
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_notifications_user_unread ON notifications (user_id, is_read)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_loan_requests_lender_status ON loan_requests (lender_id, status, created_at DESC)"
+        )
+        
+        # User dashboard lists (newest first) and the lender's "user's pending request" lookup
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications (user_id, created_at DESC)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_loan_requests_user_created ON loan_requests (user_id, created_at DESC)"
+        )
+        # A user's latest pending request (lender search, verified score pricing): partial, so it holds
+        # only pending rows, and covering - loan_type and the rowid id are read from the index alone.
+        # status is keyed as well: matching two columns is what makes the planner prefer it over the index above
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_loan_requests_user_pending ON loan_requests (user_id, status, created_at DESC, loan_type) WHERE status = 'pending'"
+        )
+        
+        # Migrations and the version bump commit together: an interrupted run is rolled back and redone
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         conn.commit()
 
 # Initialize Flask app
@@ -364,18 +954,23 @@ app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "change-this-secret-key"
 app.config["DATABASE"] = str(DB_PATH)
 app.config["UPLOAD_FOLDER"] = str(UPLOAD_FOLDER)
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max file size
+app.config["LLM_CACHE_MODE"] = LLM_CACHE_MODE
+
+# Constants every template can use without passing them to render_template
+app.jinja_env.globals["LOAN_TYPES"] = LOAN_TYPES
 
 # Initialize database
-init_db(app)
+if not IN_PARSE_WORKER:
+    init_db(app)
+app.teardown_appcontext(release_db)
 
 
 @app.route("/api/financial-trends")
+@require_role("user", api=True)
 def api_financial_trends():
     """Month-wise trends for dashboard charts (quick + verified)."""
-    if "user_id" not in session or session.get("role") != "user":
-        return jsonify({"error": "Unauthorized"}), 401
 
-    user_id = session["user_id"]
+    user_id = g.actor_id
     with get_db(app) as conn:
         # verified scores (for income/expense/savings/upi/hybrid)
         cur = conn.execute(
@@ -419,11 +1014,11 @@ def api_financial_trends():
         bank_json = {}
         upi_json = {}
         try:
-            bank_json = json.loads(r["bank_json"]) if r["bank_json"] else {}
+            bank_json = load_json(r["bank_json"]) if r["bank_json"] else {}
         except Exception:
             bank_json = {}
         try:
-            upi_json = json.loads(r["upi_json"]) if r["upi_json"] else {}
+            upi_json = load_json(r["upi_json"]) if r["upi_json"] else {}
         except Exception:
             upi_json = {}
 
@@ -459,37 +1054,164 @@ def api_financial_trends():
     return jsonify(payload)
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(ALLOWED_SUFFIXES)
+
+def save_upload(file_storage):
+    """
+    Stream an uploaded file to a unique path in UPLOAD_FOLDER and return (path, content SHA256).
+    The hash is computed while writing. Only uploads needed after the request go to disk -
+    one-shot uploads are parsed straight from file_storage.stream.
+    """
+    suffix = Path(secure_filename(file_storage.filename)).suffix.lower()
+    fd, filepath = tempfile.mkstemp(dir=app.config["UPLOAD_FOLDER"], suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            file_hash = save_and_hash(file_storage.stream, f)
+    except BaseException:
+        # Never leave a partial upload behind
+        os.unlink(filepath)
+        raise
+    return filepath, file_hash
+
+def remove_uploads(payload):
+    """Delete the uploaded documents a verified_files pending payload points to (already-gone files are skipped)"""
+    for file_path in payload.get("files", {}).values():
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+def stash_pending(kind, payload):
+    """Store transient flow data for the current user, keeping only its row id in the session"""
+    replaced = None
+    with get_db(app) as conn:
+        if kind == "verified_files":
+            # A re-upload replaces the earlier row, which is the only record of its files
+            conn.execute("BEGIN IMMEDIATE")
+            replaced = conn.execute(
+                "SELECT payload FROM pending WHERE user_id = ? AND kind = ?",
+                (session["user_id"], kind)
+            ).fetchone()
+        cur = conn.execute(
+            "INSERT OR REPLACE INTO pending (user_id, kind, payload) VALUES (?, ?, ?)",
+            (session["user_id"], kind, dump_json(payload))
+        )
+    if replaced:
+        remove_uploads(load_json(replaced["payload"]))
+    session[f"pending_{kind}"] = cur.lastrowid
+
+def load_pending(kind):
+    """Load transient flow data stored by stash_pending (None if missing)"""
+    pending_id = session.get(f"pending_{kind}")
+    if pending_id is None:
+        return None
+    with get_db(app) as conn:
+        cur = conn.execute(
+            "SELECT payload FROM pending WHERE id = ? AND user_id = ?",
+            (pending_id, session["user_id"])
+        )
+        row = cur.fetchone()
+    return load_json(row["payload"]) if row else None
+
+SCORE_DOCUMENT_COLUMNS = ("cibil_json", "bank_json", "upi_json", "salary_json", "behavior_json")
+SCORE_DERIVED_COLUMNS = ("affordability_json", "interest_rate_json", "improvement_plan_json")
+# Document columns lender_user_score.html renders (it never shows the UPI data)
+LENDER_VIEW_COLUMNS = ("cibil_json", "bank_json", "salary_json", "behavior_json")
+# Lender score page ETags change whenever the code or template that renders the page changes -
+# including the engines that recompute the derived fields older rows are missing
+SCORE_VIEW_SOURCES = (
+    Path(__file__),
+    BASE_DIR / "templates" / "lender_user_score.html",
+    BASE_DIR / "utils" / "build_verified_dataset.py",
+    BASE_DIR / "utils" / "risk_engine.py",
+    BASE_DIR / "utils" / "interest_rate_engine.py",
+    BASE_DIR / "utils" / "affordability_engine.py",
+    BASE_DIR / "utils" / "improvement_plans.py",
+)
+SCORE_VIEW_SOURCE_DIGEST = hashlib.blake2b(
+    b"".join(source.read_bytes() for source in SCORE_VIEW_SOURCES),
+    digest_size=8,
+).hexdigest()
+
+def load_json_columns(row, columns):
+    """
+    Parse the JSON text columns of a score row (sqlite3.Row or dict) into {column: value}.
+    NULL, empty, malformed or missing columns (older rows) come back as None.
+    """
+    # One pass over the row instead of a keys() scan plus two by-name Row lookups per column
+    values = dict(row)
+    parsed = {}
+    for column in columns:
+        text = values.get(column)
+        try:
+            parsed[column] = load_json(text) if text else None
+        except ValueError:
+            parsed[column] = None
+    return parsed
+
+def score_view_etag(*parts):
+    """ETag for a lender score page, from the values the page is rendered from"""
+    return hashlib.blake2b(repr((SCORE_VIEW_SOURCE_DIGEST,) + parts).encode(), digest_size=8).hexdigest()
+
+def private_page(response, etag):
+    """Tag a per-account page for revalidation: the browser keeps it but must check the ETag before reuse"""
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def drop_pending(kind):
+    """Delete transient flow data once the flow step that needed it is done"""
+    pending_id = session.pop(f"pending_{kind}", None)
+    if pending_id is None:
+        return
+    with get_db(app) as conn:
+        conn.execute(
+            "DELETE FROM pending WHERE id = ? AND user_id = ?",
+            (pending_id, session["user_id"])
+        )
+
+def collect_keywords(keyword_re, text, found):
+    """Add the distinct keywords in text to found, a set per named group of an alternation pattern"""
+    for match in keyword_re.finditer(text):
+        found[match.lastgroup].add(match.group().lower())
+
+def sum_amounts(amounts):
+    """Sum amount strings captured by the parser patterns ("1,200.50" -> 1200.5)"""
+    return sum(float(a.replace(',', '')) for a in amounts)
 
 def extract_cibil_from_pdf(pdf_path):
-    """Extract CIBIL score and related info from PDF (Quick Score flow - kept for compatibility)"""
+    """
+    Extract CIBIL score and related info from PDF (Quick Score flow - kept for compatibility).
+    Pages are extracted one at a time; every page is read, since late payments and loan
+    keywords are counted across the whole report.
+    """
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text() or ""
-        
-        # Look for CIBIL score (typically 300-900)
-        score_pattern = r'(?:CIBIL|credit\s*score|score)[\s:]*(\d{3})'
-        score_match = re.search(score_pattern, text, re.IGNORECASE)
-        cibil_score = int(score_match.group(1)) if score_match else None
-        
-        # Extract loan history keywords
-        loan_keywords = ['loan', 'credit card', 'mortgage', 'EMI']
-        loan_count = sum(1 for keyword in loan_keywords if keyword.lower() in text.lower())
-        
-        # Look for late payments
-        late_pattern = r'(?:late|delayed|overdue|missed).*?payment'
-        late_payments = len(re.findall(late_pattern, text, re.IGNORECASE))
-        
-        # Credit utilization (look for percentage)
-        util_pattern = r'(\d+(?:\.\d+)?)\s*%'
-        util_matches = re.findall(util_pattern, text)
-        credit_utilization = float(util_matches[0]) if util_matches else None
+        cibil_score = None
+        loan_keywords = set()
+        late_payments = 0
+        credit_utilization = None
+        
+        for text in iter_pdf_page_texts(pdf_path):
+            # Look for CIBIL score (typically 300-900)
+            if cibil_score is None:
+                score_match = CIBIL_SCORE_RE.search(text)
+                cibil_score = int(score_match.group(1)) if score_match else None
+            
+            # Extract loan history keywords
+            loan_keywords.update(match.lower() for match in LOAN_KEYWORD_RE.findall(text))
+            
+            # Look for late payments
+            late_payments += len(LATE_PAYMENT_RE.findall(text))
+            
+            # Credit utilization (look for percentage)
+            if credit_utilization is None:
+                util_match = UTILIZATION_RE.search(text)
+                credit_utilization = float(util_match.group(1)) if util_match else None
         
         return {
             'cibil_score': cibil_score,
-            'loan_history_summary': loan_count,
+            'loan_history_summary': len(loan_keywords),
             'late_payments': late_payments,
             'credit_utilization': credit_utilization
         }
@@ -499,34 +1221,44 @@ def extract_cibil_from_pdf(pdf_path):
 def parse_upi_csv(csv_path):
     """Parse UPI transaction CSV (Quick Score flow - kept for compatibility)"""
     try:
-        df = pd.read_csv(csv_path)
+        df = read_upi_csv(csv_path)
         
         # Common column name variations
-        amount_cols = [col for col in df.columns if 'amount' in col.lower() or 'rupee' in col.lower() or 'rs' in col.lower()]
-        date_cols = [col for col in df.columns if 'date' in col.lower() or 'time' in col.lower()]
-        desc_cols = [col for col in df.columns if 'desc' in col.lower() or 'note' in col.lower() or 'remark' in col.lower()]
+        columns = lowercase_columns(df)
+        amount_cols = match_columns(columns, ('amount', 'rupee', 'rs'))
+        date_cols = match_columns(columns, ('date', 'time'))
+        desc_cols = match_columns(columns, ('desc', 'note', 'remark'))
         
         amount_col = amount_cols[0] if amount_cols else df.columns[1]
-        date_col = date_cols[0] if date_cols else df.columns[0]
-        
-        # Clean amount column
-        df[amount_col] = df[amount_col].astype(str).str.replace(r'[^\d.]', '', regex=True)
-        df[amount_col] = pd.to_numeric(df[amount_col], errors='coerce')
         
+        # Keep only the columns we use and release the rest of the frame straight away
         total_transactions = len(df)
-        total_spend = df[amount_col].abs().sum()
+        raw_amounts = df[amount_col]
+        descriptions = df[desc_cols[0]] if desc_cols else None
+        dates = df[date_cols[0]] if date_cols else None
+        del df
+        
+        # Clean amount column (only run the regex cleanup on values that are not already numeric)
+        amounts = pd.to_numeric(raw_amounts, errors='coerce')
+        unparsed = amounts.isna() & raw_amounts.notna()
+        if unparsed.any():
+            cleaned = raw_amounts[unparsed].astype(str).str.replace(r'[^\d.]', '', regex=True)
+            amounts[unparsed] = pd.to_numeric(cleaned, errors='coerce')
+        del raw_amounts
+        
+        total_spend = amounts.abs().sum()
         
         # Categorize transactions
-        bill_keywords = ['bill', 'electricity', 'water', 'gas', 'phone', 'internet', 'recharge']
-        bill_payments = sum(1 for desc in (df[desc_cols[0]] if desc_cols else pd.Series([''])) 
-                          if any(kw in str(desc).lower() for kw in bill_keywords))
+        if descriptions is not None:
+            bill_payments = int(descriptions.astype(str).str.contains(UPI_CSV_BILL_PATTERN, case=False, regex=True, na=False).sum())
+        else:
+            bill_payments = 0
         
         # Regularity check (transactions per day)
-        if date_cols:
-            df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
-            df = df.dropna(subset=[date_col])
-            if len(df) > 0:
-                date_range = (df[date_col].max() - df[date_col].min()).days
+        if dates is not None:
+            dates = pd.to_datetime(dates, errors='coerce').dropna()
+            if len(dates) > 0:
+                date_range = (dates.max() - dates.min()).days
                 regularity = total_transactions / max(date_range, 1)
             else:
                 regularity = 0
@@ -546,24 +1278,26 @@ def parse_upi_csv(csv_path):
 def parse_upi_pdf(pdf_path):
     """Parse UPI transaction PDF (Quick Score flow - kept for compatibility)"""
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text() or ""
+        amount_strings = []
+        keywords = {name: set() for name in UPI_KEYWORD_RE.groupindex}
         
-        # Extract amounts (UPI transactions typically show amounts)
-        amounts = re.findall(r'₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)', text)
-        amounts = [float(a.replace(',', '')) for a in amounts if a.replace(',', '').replace('.', '').isdigit()]
+        # Scan page by page instead of joining the whole statement into one string
+        for text in iter_pdf_page_texts(pdf_path):
+            # Extract amounts (UPI transactions typically show amounts)
+            amount_strings.extend(a.replace(',', '') for a in UPI_AMOUNT_RE.findall(text))
+            
+            # Collect transaction and bill keywords in one pass
+            collect_keywords(UPI_KEYWORD_RE, text, keywords)
         
-        # Count transactions
-        transaction_keywords = ['upi', 'payment', 'transfer', 'debit', 'credit']
-        transaction_count = sum(1 for keyword in transaction_keywords if keyword.lower() in text.lower())
+        # The amount pattern only matches digits/commas/decimals, so every match converts cleanly
+        amounts = np.array(amount_strings, dtype=np.float64)
+        keyword_counts = {name: len(found) for name, found in keywords.items()}
+        transaction_count = keyword_counts["transaction"]
         
-        total_spend = sum(amounts) if amounts else 0
+        total_spend = float(amounts.sum())
         
         # Bill payments
-        bill_keywords = ['bill', 'electricity', 'water', 'gas', 'phone', 'recharge']
-        bill_payments = sum(1 for keyword in bill_keywords if keyword.lower() in text.lower())
+        bill_payments = keyword_counts["bill"]
         
         return {
             'total_transactions': max(transaction_count, len(amounts)),
@@ -578,39 +1312,34 @@ def parse_upi_pdf(pdf_path):
 def parse_bank_statement(pdf_path):
     """Parse bank statement PDF"""
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text() or ""
-        
-        # Extract account balance patterns
-        balance_patterns = [
-            r'(?:balance|bal|available)[\s:]*₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
-            r'₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:balance|bal)'
-        ]
         balances = []
-        for pattern in balance_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            balances.extend([float(m.replace(',', '')) for m in matches])
+        debits = []
+        credits = []
+        emi_keywords = set()
+        negative_balance = False
+        
+        # Scan page by page instead of joining the whole statement into one string
+        for text in iter_pdf_page_texts(pdf_path):
+            # Extract account balance patterns
+            for pattern in BANK_BALANCE_RES:
+                balances.extend(float(m.replace(',', '')) for m in pattern.findall(text))
+            
+            # Extract transaction patterns
+            debits.extend(BANK_DEBIT_RE.findall(text))
+            credits.extend(BANK_CREDIT_RE.findall(text))
+            
+            # EMI/loan payments
+            emi_keywords.update(match.lower() for match in EMI_KEYWORD_RE.findall(text))
+            
+            # Check for overdraft or negative balance
+            negative_balance = negative_balance or NEGATIVE_BALANCE_RE.search(text) is not None
         
         avg_balance = sum(balances) / len(balances) if balances else 0
         
-        # Extract transaction patterns
-        debit_pattern = r'(?:debit|withdrawal|payment)[\s:]*₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)'
-        credit_pattern = r'(?:credit|deposit|salary)[\s:]*₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)'
-        
-        debits = re.findall(debit_pattern, text, re.IGNORECASE)
-        credits = re.findall(credit_pattern, text, re.IGNORECASE)
+        total_debits = sum_amounts(debits)
+        total_credits = sum_amounts(credits)
         
-        total_debits = sum([float(d.replace(',', '')) for d in debits])
-        total_credits = sum([float(c.replace(',', '')) for c in credits])
-        
-        # Count EMI/loan payments
-        emi_keywords = ['emi', 'loan', 'installment', 'repayment']
-        emi_count = sum(1 for keyword in emi_keywords if keyword.lower() in text.lower())
-        
-        # Check for overdraft or negative balance
-        negative_balance = any('overdraft' in text.lower() or 'negative' in text.lower() or 'insufficient' in text.lower())
+        emi_count = len(emi_keywords)
         
         return {
             'avg_balance': float(avg_balance),
@@ -626,38 +1355,30 @@ def parse_bank_statement(pdf_path):
 def parse_salary_slip(pdf_path):
     """Parse salary slip PDF"""
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text() or ""
-        
-        # Extract salary/gross/net pay
-        salary_patterns = [
-            r'(?:gross|salary|net\s*pay|total)[\s:]*₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
-            r'₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:gross|salary|net)'
-        ]
         salaries = []
-        for pattern in salary_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            salaries.extend([float(m.replace(',', '')) for m in matches])
+        total_deductions = 0.0
+        emp_id = None
+        is_regular = False
+        
+        # Scan page by page instead of joining the whole slip into one string
+        for text in iter_pdf_page_texts(pdf_path):
+            # Extract salary/gross/net pay
+            for pattern in SALARY_RES:
+                salaries.extend(float(m.replace(',', '')) for m in pattern.findall(text))
+            
+            # Extract deductions
+            total_deductions += sum_amounts(SALARY_DEDUCTION_RE.findall(text))
+            
+            # Extract employee ID or name (first match wins)
+            if emp_id is None:
+                emp_id_match = SALARY_EMP_ID_RE.search(text)
+                emp_id = emp_id_match.group(1) if emp_id_match else None
+            
+            # Check for regular employment (monthly pattern)
+            is_regular = is_regular or SALARY_MONTH_RE.search(text) is not None
         
         gross_salary = max(salaries) if salaries else None
         
-        # Extract deductions
-        deduction_pattern = r'(?:deduction|pf|tax|tds)[\s:]*₹?\s*(\d+(?:,\d+)*(?:\.\d{2})?)'
-        deductions = re.findall(deduction_pattern, text, re.IGNORECASE)
-        total_deductions = sum([float(d.replace(',', '')) for d in deductions])
-        
-        # Extract employee ID or name
-        emp_id_pattern = r'(?:employee\s*id|emp\s*id|id)[\s:]*([A-Z0-9]+)'
-        emp_id_match = re.search(emp_id_pattern, text, re.IGNORECASE)
-        emp_id = emp_id_match.group(1) if emp_id_match else None
-        
-        # Check for regular employment (monthly pattern)
-        month_pattern = r'(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\w*\s*\d{4}'
-        months_found = len(re.findall(month_pattern, text, re.IGNORECASE))
-        is_regular = months_found > 0
-        
         return {
             'gross_salary': float(gross_salary) if gross_salary else None,
             'net_salary': float(gross_salary - total_deductions) if gross_salary else None,
@@ -668,97 +1389,70 @@ def parse_salary_slip(pdf_path):
     except Exception as e:
         return {'error': str(e)}
 
-def calculate_behavioral_score(data):
-    """Use Gemini LLM to calculate behavioral score"""
-    prompt = f"""
-You are a financial behavior analyst. Based on the following user data, calculate behavioral scores.
-
-User Data:
-- Monthly Income: {data.get('monthly_income', 'N/A')}
-- Income Stability: {data.get('income_stability', 'N/A')}
-- Monthly Expenses: {data.get('monthly_expenses', 'N/A')}
-- Monthly Savings: {data.get('monthly_savings', 'N/A')}
-- Emergency Fund: {data.get('emergency_fund', 'N/A')}
-- Paid Bills On Time: {data.get('paid_bills_on_time', 'N/A')}
-- Missed Payments: {data.get('missed_payments', 'N/A')}
-- Monthly UPI Transactions: {data.get('monthly_upi_transactions', 'N/A')}
-- Digital vs Cash: {data.get('digital_vs_cash', 'N/A')}
-- Tracks Expenses: {data.get('tracks_expenses', 'N/A')}
-- Overspends Often: {data.get('overspends_often', 'N/A')}
-- Sudden Big Expenses: {data.get('sudden_big_expenses', 'N/A')}
-- UPI Data: {json.dumps(data.get('upi_data', {}), indent=2)}
-
-Calculate the following scores (each on a scale of 0-10):
-1. income_stability_score
-2. spending_discipline_score
-3. savings_behavior_score
-4. payment_discipline_score
-5. digital_behavior_score
-6. lifestyle_stability_score
+def llm_cache_lookup(cache_key):
+    """Cached LLM response for cache_key, or None on a miss or when LLM_CACHE_MODE is disabled"""
+    if app.config["LLM_CACHE_MODE"] == "disabled":
+        return None
+    with get_db(app) as conn:
+        return get_cached_llm_response(conn, cache_key)
 
-Then calculate a final behavior_score (0-10) as a weighted average:
-- income_stability: 15%
-- spending_discipline: 20%
-- savings_behavior: 20%
-- payment_discipline: 25%
-- digital_behavior: 10%
-- lifestyle_stability: 10%
+def llm_cache_store(cache_key, result):
+    """Store an LLM response when LLM_CACHE_MODE allows writes"""
+    if app.config["LLM_CACHE_MODE"] == "enabled":
+        with get_db(app) as conn:
+            save_llm_response(conn, cache_key, result)
 
-Respond ONLY with valid JSON in this exact format:
-{{
-  "income_stability_score": <number 0-10>,
-  "spending_discipline_score": <number 0-10>,
-  "savings_behavior_score": <number 0-10>,
-  "payment_discipline_score": <number 0-10>,
-  "digital_behavior_score": <number 0-10>,
-  "lifestyle_stability_score": <number 0-10>,
-  "behavior_score": <number 0-10>,
-  "explanation": "<3-4 bullet points explaining the score>",
-  "key_insights": {{
-    "positive": ["<what increased score>", "<another positive>"],
-    "negative": ["<what reduced score>", "<another negative>"]
-  }},
-  "improvement_tips": ["<tip 1>", "<tip 2>", "<tip 3>", "<tip 4>"]
-}}
-"""
+def calculate_behavioral_score(data):
+    """Use Gemini LLM to calculate behavioral score"""
+    # Rubric lives in the model's system instruction; only the user data is sent per request
+    prompt = json.dumps({"user_data": data}, sort_keys=True, separators=(",", ":"))
+    
+    # Check LLM response cache first (same prompt = same answer, no API call)
+    cache_key = hash_prompt(prompt, QUICK_SCORE_CACHE_MODEL)
+    cached_response = llm_cache_lookup(cache_key)
+    if cached_response is not None:
+        return cached_response
+    if app.config["LLM_CACHE_MODE"] == "replay":
+        return _default_behavioral_score("No cached AI analysis available in replay mode. Using default scores.")
     
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        # Extract JSON from response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
-        else:
+        response = generate_content(quick_score_model, prompt)
+        
+        # JSON response mode - the body is the JSON document itself
+        result = parse_llm_json(response.text)
+        if not isinstance(result, dict):
             # Fallback scoring
-            return {
-                "income_stability_score": 7.0,
-                "spending_discipline_score": 7.0,
-                "savings_behavior_score": 7.0,
-                "payment_discipline_score": 7.0,
-                "digital_behavior_score": 7.0,
-                "lifestyle_stability_score": 7.0,
-                "behavior_score": 7.0,
-                "explanation": "Based on provided data, moderate financial behavior observed.",
-                "key_insights": {"positive": [], "negative": []},
-                "improvement_tips": ["Maintain consistent savings", "Pay bills on time", "Track expenses regularly"]
-            }
+            return _default_behavioral_score("Based on provided data, moderate financial behavior observed.")
+        llm_cache_store(cache_key, result)
+        return result
     except Exception as e:
         # Fallback scoring
-        return {
-            "income_stability_score": 7.0,
-            "spending_discipline_score": 7.0,
-            "savings_behavior_score": 7.0,
-            "payment_discipline_score": 7.0,
-            "digital_behavior_score": 7.0,
-            "lifestyle_stability_score": 7.0,
-            "behavior_score": 7.0,
-            "explanation": f"Error in AI analysis: {str(e)}. Using default scores.",
-            "key_insights": {"positive": [], "negative": []},
-            "improvement_tips": ["Maintain consistent savings", "Pay bills on time", "Track expenses regularly"]
-        }
+        print(f"Gemini Quick Score error: {e}")
+        return _default_behavioral_score(LLM_ERROR_EXPLANATION)
+
+def _default_behavioral_score(explanation):
+    """Fallback Quick Score result when the LLM is unavailable"""
+    result = copy.deepcopy(DEFAULT_BEHAVIOR_SCORE)
+    result["explanation"] = explanation
+    return result
+
+def score_verified_dataset(dataset):
+    """
+    Gemini verified scoring, memoized in llm_cache by prompt hash.
+    Identical datasets (e.g. re-uploads with different file bytes) reuse the stored result.
+    """
+    cache_key = hash_prompt(build_scoring_prompt(dataset), SCORING_MODEL_NAME)
+    cached_response = llm_cache_lookup(cache_key)
+    if cached_response is not None:
+        return cached_response
+    if app.config["LLM_CACHE_MODE"] == "replay":
+        return get_fallback_score()
+    
+    result = call_gemini_pro_for_scoring(dataset)
+    # Never cache the fallback - the next request should retry the API
+    if result != FALLBACK_SCORE:
+        llm_cache_store(cache_key, result)
+    return result
 
 def calculate_hybrid_score(cibil_score, behavior_score):
     """Calculate hybrid score"""
@@ -815,87 +1509,44 @@ Respond ONLY with valid JSON in this exact format:
 """
     
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        # Extract JSON from response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
-        else:
-            # Fallback scoring
-            return {
-                "income_stability_score": 7.0,
-                "spending_discipline_score": 7.0,
-                "savings_behavior_score": 7.0,
-                "payment_discipline_score": 7.0,
-                "digital_behavior_score": 7.0,
-                "lifestyle_stability_score": 7.0,
-                "behavior_score": 7.0,
-                "explanation": "Based on verified documents, moderate financial behavior observed.",
-                "key_insights": {"positive": [], "negative": []},
-                "red_flags": [],
-                "improvement_tips": ["Maintain consistent savings", "Pay bills on time", "Track expenses regularly"]
-            }
+        response = generate_content(gemini_model, prompt)
+        
+        # JSON response mode - the body is the JSON document itself
+        result = parse_llm_json(response.text)
+        if isinstance(result, dict):
+            return result
+        # Fallback scoring
+        return _default_verified_score("Based on verified documents, moderate financial behavior observed.")
     except Exception as e:
         # Fallback scoring
-        return {
-            "income_stability_score": 7.0,
-            "spending_discipline_score": 7.0,
-            "savings_behavior_score": 7.0,
-            "payment_discipline_score": 7.0,
-            "digital_behavior_score": 7.0,
-            "lifestyle_stability_score": 7.0,
-            "behavior_score": 7.0,
-            "explanation": f"Error in AI analysis: {str(e)}. Using default scores.",
-            "key_insights": {"positive": [], "negative": []},
-            "red_flags": [],
-            "improvement_tips": ["Maintain consistent savings", "Pay bills on time", "Track expenses regularly"]
-        }
+        print(f"Gemini verified score error: {e}")
+        return _default_verified_score(LLM_ERROR_EXPLANATION)
 
-def calculate_loan_type_score(behavior_json, loan_type, cibil_score, salary_json=None):
-    """Calculate loan-type-specific score and recommendation"""
-    behavior_score = behavior_json.get('behavior_score', 7.0) if isinstance(behavior_json, dict) else 7.0
+def _default_verified_score(explanation):
+    """Fallback verified score result when the LLM is unavailable"""
+    result = _default_behavioral_score(explanation)
+    result["red_flags"] = []
+    return result
+
+def calculate_loan_type_score(loan_type, cibil_score, behavior_score=7.0, salary=None):
+    """
+    Calculate loan-type-specific score and recommendation.
+    Takes the few scalars it scores on (salary = monthly gross, else net), not the parsed documents.
+    """
     hybrid_score = calculate_hybrid_score(cibil_score, behavior_score)
     
-    # Loan-type-specific risk weights
-    risk_weights = {
-        'personal': {'cibil_weight': 0.5, 'behavior_weight': 0.5},
-        'home': {'cibil_weight': 0.6, 'behavior_weight': 0.4},
-        'education': {'cibil_weight': 0.4, 'behavior_weight': 0.6},
-        'business': {'cibil_weight': 0.45, 'behavior_weight': 0.55},
-        'vehicle': {'cibil_weight': 0.5, 'behavior_weight': 0.5},
-        'gold': {'cibil_weight': 0.3, 'behavior_weight': 0.7},
-        'other': {'cibil_weight': 0.5, 'behavior_weight': 0.5}
-    }
-    
-    weights = risk_weights.get(loan_type, risk_weights['other'])
-    adjusted_score = (cibil_score * weights['cibil_weight']) + ((behavior_score * 100) * weights['behavior_weight'])
+    cibil_weight, behavior_weight = LOAN_TYPE_RISK_WEIGHTS.get(loan_type, LOAN_TYPE_RISK_WEIGHTS['other'])
+    adjusted_score = (cibil_score * cibil_weight) + ((behavior_score * 100) * behavior_weight)
     
     # EMI affordability (simplified calculation)
     # Assuming 30% of income can go to EMI
-    salary = None
-    if salary_json:
-        salary = salary_json.get('gross_salary') or salary_json.get('net_salary')
     if salary:
         max_emi = salary * 0.3
     else:
         max_emi = None
     
     # Default risk prediction
-    if adjusted_score >= 750:
-        risk_level = "Low"
-        recommendation = "Approve"
-    elif adjusted_score >= 650:
-        risk_level = "Medium"
-        recommendation = "Approve with Caution"
-    elif adjusted_score >= 550:
-        risk_level = "Medium-High"
-        recommendation = "Caution / Need more documents"
-    else:
-        risk_level = "High"
-        recommendation = "Reject"
+    risk_level, recommendation = LOAN_RISK_LEVELS[bisect.bisect_right(LOAN_RISK_THRESHOLDS, adjusted_score)]
     
     return {
         'adjusted_score': adjusted_score,
@@ -915,13 +1566,13 @@ def index():
 def signup():
     """User/Lender registration"""
     if request.method == "POST":
-        username = request.form.get("username", "").strip()
-        email = request.form.get("email", "").strip().lower()
+        username = form_text("username")
+        email = form_email()
         password = request.form.get("password", "")
         confirm_password = request.form.get("confirm_password", "")
-        phone = request.form.get("phone", "").strip()
+        phone = form_text("phone")
         role = request.form.get("role", "user")  # 'user' or 'lender'
-        org_name = request.form.get("org_name", "").strip() if role == "lender" else None
+        org_name = form_text("org_name") if role == "lender" else None
         loan_types = request.form.getlist("loan_types") if role == "lender" else None
 
         if not username or not email or not password:
@@ -936,47 +1587,23 @@ def signup():
             flash("Passwords do not match.", "error")
             return redirect(url_for("signup"))
 
-        hashed = generate_password_hash(password)
+        hashed = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
 
         try:
             with get_db(app) as conn:
+                # The account and its loan types are written together
+                conn.execute("BEGIN IMMEDIATE")
                 if role == "lender":
-                    unique_lender_id = generate_unique_lender_id()
-                    # Ensure uniqueness
-                    while True:
-                        check_cur = conn.execute("SELECT id FROM lenders WHERE unique_lender_id = ?", (unique_lender_id,))
-                        if check_cur.fetchone() is None:
-                            break
-                        unique_lender_id = generate_unique_lender_id()
-                    
-                    loan_types_json = json.dumps(loan_types) if loan_types else "[]"
-                    conn.execute(
-                        """INSERT INTO lenders (unique_lender_id, name, email, password_hash, org_name, loan_types_offered, role)
-                           VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                        (unique_lender_id, username, email, hashed, org_name, loan_types_json, role),
+                    lender_id, unique_lender_id = insert_with_unique_id(
+                        conn, INSERT_LENDER_SQL, generate_unique_lender_id, "lenders.unique_lender_id",
+                        (username, email, hashed, org_name, role),
                     )
+                    set_lender_loan_types(conn, lender_id, loan_types)
                     flash(f"Lender account created! Your Lender ID: {unique_lender_id}", "success")
                 else:
-                    unique_user_id = generate_unique_user_id()
-                    # Ensure uniqueness
-                    while True:
-                        check_cur = conn.execute("SELECT id FROM users WHERE unique_user_id = ?", (unique_user_id,))
-                        if check_cur.fetchone() is None:
-                            break
-                        unique_user_id = generate_unique_user_id()
-                    
-                    # Check if unique_user_id column exists, if not, add it
-                    cur = conn.execute("PRAGMA table_info(users)")
-                    columns = [row[1] for row in cur.fetchall()]
-                    if 'unique_user_id' not in columns:
-                        conn.execute("ALTER TABLE users ADD COLUMN unique_user_id TEXT")
-                    if 'phone' not in columns:
-                        conn.execute("ALTER TABLE users ADD COLUMN phone TEXT")
-                    
-                    conn.execute(
-                        """INSERT INTO users (unique_user_id, username, email, password_hash, role, phone)
-                           VALUES (?, ?, ?, ?, ?, ?)""",
-                        (unique_user_id, username, email, hashed, role, phone),
+                    _, unique_user_id = insert_with_unique_id(
+                        conn, INSERT_USER_SQL, generate_unique_user_id, "users.unique_user_id",
+                        (username, email, hashed, role, phone),
                     )
                     flash(f"Account created successfully! Your User ID: {unique_user_id}", "success")
             return redirect(url_for("signin"))
@@ -984,52 +1611,25 @@ def signup():
             flash("A user with that email already exists.", "error")
             return redirect(url_for("signup"))
         except sqlite3.OperationalError as e:
-            # If column doesn't exist, try to add it and retry
-            if "no column named unique_user_id" in str(e).lower():
-                with get_db(app) as conn:
-                    conn.execute("ALTER TABLE users ADD COLUMN unique_user_id TEXT")
-                    # Retry the insert
-                    unique_user_id = generate_unique_user_id()
-                    while True:
-                        check_cur = conn.execute("SELECT id FROM users WHERE unique_user_id = ?", (unique_user_id,))
-                        if check_cur.fetchone() is None:
-                            break
-                        unique_user_id = generate_unique_user_id()
-                    # Check if phone column exists
-                    cur = conn.execute("PRAGMA table_info(users)")
-                    columns = [row[1] for row in cur.fetchall()]
-                    if 'phone' not in columns:
-                        conn.execute("ALTER TABLE users ADD COLUMN phone TEXT")
-                    
-                    conn.execute(
-                        """INSERT INTO users (unique_user_id, username, email, password_hash, role, phone)
-                           VALUES (?, ?, ?, ?, ?, ?)""",
-                        (unique_user_id, username, email, hashed, role, phone),
-                    )
-                    flash(f"Account created successfully! Your User ID: {unique_user_id}", "success")
-                    return redirect(url_for("signin"))
-            else:
-                flash(f"Database error: {str(e)}", "error")
-                return redirect(url_for("signup"))
+            # Schema migrations run once in init_db; this only reports e.g. a locked database
+            flash(f"Database error: {str(e)}", "error")
+            return redirect(url_for("signup"))
 
-    return render_template("signup.html", loan_types=LOAN_TYPES)
+    return render_template("signup.html")
 
 @app.route("/signin", methods=["GET", "POST"])
 def signin():
     """User/Lender login"""
     if request.method == "POST":
-        email = request.form.get("email", "").strip().lower()
+        email = form_email()
         password = request.form.get("password", "")
         role = request.form.get("role", "user")  # 'user' or 'lender'
 
         with get_db(app) as conn:
             if role == "lender":
-                cur = conn.execute(
-                    "SELECT id, unique_lender_id, name, email, password_hash, org_name FROM lenders WHERE email = ?",
-                    (email,),
-                )
+                cur = conn.execute(SELECT_LENDER_BY_EMAIL_SQL, (email,))
                 user = cur.fetchone()
-                if user and check_password_hash(user["password_hash"], password):
+                if password_matches(user, password):
                     session["lender_id"] = user["id"]
                     session["unique_lender_id"] = user["unique_lender_id"]
                     session["username"] = user["name"]
@@ -1037,12 +1637,9 @@ def signin():
                     flash(f"Welcome back, {user['name']}!", "success")
                     return redirect(url_for("lender_dashboard"))
             else:
-                cur = conn.execute(
-                    "SELECT id, unique_user_id, username, email, password_hash FROM users WHERE email = ?",
-                    (email,),
-                )
+                cur = conn.execute(SELECT_USER_BY_EMAIL_SQL, (email,))
                 user = cur.fetchone()
-                if user and check_password_hash(user["password_hash"], password):
+                if password_matches(user, password):
                     session["user_id"] = user["id"]
                     session["unique_user_id"] = user["unique_user_id"]
                     session["username"] = user["username"]
@@ -1056,48 +1653,36 @@ def signin():
     return render_template("signin.html")
 
 @app.route("/dashboard")
+@require_role("user")
 def dashboard():
     """User dashboard (protected)"""
-    if "user_id" not in session or session.get("role") != "user":
-        return redirect(url_for("signin"))
     
     with get_db(app) as conn:
-        # Get unique user ID
-        cur = conn.execute(
-            "SELECT unique_user_id FROM users WHERE id = ?",
-            (session["user_id"],)
-        )
+        # Get unique user ID, phone and unread notification count
+        cur = conn.execute(DASHBOARD_USER_SQL, (g.actor_id,))
         user = cur.fetchone()
         unique_user_id = user["unique_user_id"] if user else None
+        unread_count = user["unread_count"] if user else 0
         
-        # Get latest quick score
-        cur = conn.execute(
-            "SELECT hybrid_score, behavior_json, created_at FROM quick_scores WHERE user_id = ? ORDER BY created_at DESC LIMIT 1",
-            (session["user_id"],)
-        )
-        latest_quick_score = cur.fetchone()
+        # Get quick score history (last 6 months) - the first row is the latest quick score
+        cur = conn.execute(DASHBOARD_QUICK_SCORES_SQL, (g.actor_id,))
+        quick_score_history = cur.fetchall()
+        latest_quick_score = quick_score_history[0] if quick_score_history else None
         
         # Get latest verified score
         cur = conn.execute(
             "SELECT hybrid_score, behavior_json, cibil_json, bank_json, upi_json, salary_json, created_at FROM verified_scores WHERE user_id = ? ORDER BY created_at DESC LIMIT 1",
-            (session["user_id"],)
+            (g.actor_id,)
         )
         latest_verified_score = cur.fetchone()
         
-        # Get quick score history (last 6 months)
-        cur = conn.execute(
-            "SELECT hybrid_score, created_at FROM quick_scores WHERE user_id = ? ORDER BY created_at DESC LIMIT 6",
-            (session["user_id"],)
-        )
-        quick_score_history = cur.fetchall()
-        
         # Get loan requests
         cur = conn.execute(
             """SELECT lr.id, lr.loan_type, lr.status, lr.decision_json, lr.created_at, l.name as lender_name
                FROM loan_requests lr
                LEFT JOIN lenders l ON lr.lender_id = l.id
                WHERE lr.user_id = ? ORDER BY lr.created_at DESC""",
-            (session["user_id"],)
+            (g.actor_id,)
         )
         loan_requests = cur.fetchall()
         
@@ -1107,20 +1692,13 @@ def dashboard():
                FROM notifications n
                LEFT JOIN lenders l ON n.lender_id = l.id
                WHERE n.user_id = ? ORDER BY n.created_at DESC LIMIT 10""",
-            (session["user_id"],)
+            (g.actor_id,)
         )
         notifications = cur.fetchall()
         
-        # Count unread notifications
-        cur = conn.execute(
-            "SELECT COUNT(*) as count FROM notifications WHERE user_id = ? AND is_read = 0",
-            (session["user_id"],)
-        )
-        unread_result = cur.fetchone()
-        unread_count = unread_result["count"] if unread_result else 0
-        
-        # Check and send monthly reminder if needed
-        check_monthly_reminder(session["user_id"], conn)
+        # Check and send monthly reminder if needed (reuses the phone and latest score fetched above)
+        if user:
+            send_reminder_if_due(user["phone"], latest_quick_score["created_at"] if latest_quick_score else None)
     
     return render_template("dashboard.html", 
                          username=session.get("username"),
@@ -1130,8 +1708,7 @@ def dashboard():
                          quick_score_history=quick_score_history,
                          loan_requests=loan_requests,
                          notifications=notifications,
-                         unread_count=unread_count,
-                         loan_types=LOAN_TYPES)
+                         unread_count=unread_count)
 
 @app.route("/check", methods=["GET", "POST"])
 def check():
@@ -1140,34 +1717,26 @@ def check():
         return redirect(url_for("signin"))
     
     if request.method == "POST":
-        cibil_score = request.form.get("cibil_score", "").strip()
+        cibil_score = form_text("cibil_score")
         cibil_file = request.files.get("cibil_file")
         
-        session["cibil_data"] = {}
+        cibil_data = {}
         
         if cibil_file and allowed_file(cibil_file.filename):
-            filename = secure_filename(cibil_file.filename)
-            filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-            cibil_file.save(filepath)
+            # Parse straight from the upload stream - the file is not needed afterwards
+            extracted = extract_cibil_from_pdf(cibil_file.stream)
             
-            extracted = extract_cibil_from_pdf(filepath)
             if extracted.get("cibil_score"):
-                session["cibil_data"] = extracted
+                cibil_data = extracted
                 session["cibil_score"] = extracted["cibil_score"]
             else:
                 flash("Could not extract CIBIL score from PDF. Please enter manually.", "error")
-            
-            # Delete file after parsing
-            try:
-                os.remove(filepath)
-            except:
-                pass
         elif cibil_score:
             try:
                 score = int(cibil_score)
                 if 300 <= score <= 900:
                     session["cibil_score"] = score
-                    session["cibil_data"] = {"cibil_score": score}
+                    cibil_data = {"cibil_score": score}
                 else:
                     flash("CIBIL score must be between 300 and 900.", "error")
                     return redirect(url_for("check"))
@@ -1178,6 +1747,7 @@ def check():
             flash("Please enter CIBIL score or upload PDF.", "error")
             return redirect(url_for("check"))
         
+        stash_pending("cibil_data", cibil_data)
         return redirect(url_for("behavior_form"))
     
     return render_template("check.html")
@@ -1214,23 +1784,21 @@ def behavior_form():
         upi_data = {}
         
         if upi_file and allowed_file(upi_file.filename):
-            filename = secure_filename(upi_file.filename)
-            filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-            upi_file.save(filepath)
-            
-            if filename.endswith('.csv'):
-                upi_data = parse_upi_csv(filepath)
-            elif filename.endswith('.pdf'):
-                upi_data = parse_upi_pdf(filepath)
+            # Re-uploading the same statement (same bytes and file type) reuses the earlier parse
+            is_csv = upi_file.filename.lower().endswith('.csv')
+            cache_key = f"{'csv' if is_csv else 'pdf'}:{hash_stream(upi_file.stream)}"
+            with get_db(app) as conn:
+                upi_data = get_cached_upi_parse(conn, cache_key)
             
-            # Delete file after parsing
-            try:
-                os.remove(filepath)
-            except:
-                pass
+            if upi_data is None:
+                # Parse straight from the upload stream - the file is not needed afterwards
+                upi_data = parse_upi_csv(upi_file.stream) if is_csv else parse_upi_pdf(upi_file.stream)
+                if "error" not in upi_data:
+                    with get_db(app) as conn:
+                        save_upi_parse(conn, cache_key, upi_data)
         
         behavior_data["upi_data"] = upi_data
-        session["behavior_data"] = behavior_data
+        stash_pending("behavior_data", behavior_data)
         
         return redirect(url_for("process_score"))
     
@@ -1242,12 +1810,12 @@ def process_score():
     if "user_id" not in session:
         return redirect(url_for("signin"))
     
-    if "behavior_data" not in session:
+    behavior_data = load_pending("behavior_data")
+    if behavior_data is None:
         flash("Please complete the behavior form first.", "error")
         return redirect(url_for("behavior_form"))
     
     cibil_score = session.get("cibil_score")
-    behavior_data = session.get("behavior_data", {})
     
     # Calculate behavioral score using LLM
     behavior_result = calculate_behavioral_score(behavior_data)
@@ -1258,24 +1826,21 @@ def process_score():
     
     # Store in quick_scores table
     with get_db(app) as conn:
-        conn.execute(
-            """INSERT INTO quick_scores (user_id, behavior_json, hybrid_score)
-               VALUES (?, ?, ?)""",
-            (session["user_id"], json.dumps(behavior_result), hybrid_score)
-        )
+        conn.execute(INSERT_QUICK_SCORE_SQL, (session["user_id"], dump_json(behavior_result), hybrid_score))
     
-    # Store in session for result page
-    session["result"] = {
+    # Store for result page
+    stash_pending("result", {
         "cibil_score": cibil_score,
         "behavior_score": behavior_score,
         "hybrid_score": hybrid_score,
         "behavior_details": behavior_result,
         "score_type": "quick"
-    }
+    })
     
     # Clear session data
     session.pop("cibil_score", None)
-    session.pop("behavior_data", None)
+    drop_pending("cibil_data")
+    drop_pending("behavior_data")
     
     return redirect(url_for("result"))
 
@@ -1285,65 +1850,70 @@ def result():
     if "user_id" not in session:
         return redirect(url_for("signin"))
     
-    if "result" not in session:
+    result_data = load_pending("result")
+    if result_data is None:
         flash("No score data found. Please start from the beginning.", "error")
         return redirect(url_for("check"))
     
-    result_data = session["result"]
     return render_template("result.html", result=result_data)
 
 @app.route("/verified-score-upload", methods=["GET", "POST"])
+@require_role("user")
 def verified_score_upload():
     """Upload official documents for verified score"""
-    if "user_id" not in session or session.get("role") != "user":
-        return redirect(url_for("signin"))
     
     if request.method == "POST":
         files_uploaded = {}
+        file_hashes = {}
         
-        # Handle CIBIL PDF
-        cibil_file = request.files.get("cibil_file")
-        if cibil_file and allowed_file(cibil_file.filename):
-            filename = secure_filename(cibil_file.filename)
-            filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-            cibil_file.save(filepath)
-            files_uploaded['cibil'] = filepath
-        
-        # Handle Bank Statement PDF
-        bank_file = request.files.get("bank_file")
-        if bank_file and allowed_file(bank_file.filename):
-            filename = secure_filename(bank_file.filename)
-            filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-            bank_file.save(filepath)
-            files_uploaded['bank'] = filepath
-        
-        # Handle UPI CSV/PDF
-        upi_file = request.files.get("upi_file")
-        if upi_file and allowed_file(upi_file.filename):
-            filename = secure_filename(upi_file.filename)
-            filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-            upi_file.save(filepath)
-            files_uploaded['upi'] = filepath
-        
-        # Handle Salary Slip PDF
-        salary_file = request.files.get("salary_file")
-        if salary_file and allowed_file(salary_file.filename):
-            filename = secure_filename(salary_file.filename)
-            filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-            salary_file.save(filepath)
-            files_uploaded['salary'] = filepath
+        # CIBIL PDF, bank statement PDF, UPI CSV/PDF, salary slip PDF -
+        # each is hashed while it streams to disk, so it is never re-read just to hash it
+        for kind in ("cibil", "bank", "upi", "salary"):
+            upload = request.files.get(f"{kind}_file")
+            if upload and allowed_file(upload.filename):
+                files_uploaded[kind], file_hashes[kind] = save_upload(upload)
         
         if not files_uploaded:
             flash("Please upload at least one document.", "error")
             return redirect(url_for("verified_score_upload"))
         
-        # Store file paths in session for processing
-        session["verified_files"] = files_uploaded
+        # Store file paths (and their combined content hash) for processing
+        stash_pending("verified_files", {
+            "files": files_uploaded,
+            "doc_hash": combine_document_hashes(file_hashes),
+        })
         return redirect(url_for("process_verified_score"))
     
     return render_template("verified_score_upload.html")
 
+VERIFIED_DOCUMENT_LABELS = {
+    'cibil': "CIBIL report",
+    'bank': "bank statement",
+    'upi': "UPI statement",
+    'salary': "salary slip",
+}
+
+def parse_verified_documents(files_uploaded):
+    """
+    Parse the uploaded verified-score documents locally (FAST - no LLM calls).
+    The documents are parsed in parallel worker processes (see utils.parse_pool).
+    Returns (cibil_json, bank_json, upi_json, salary_json); a document that fails to parse
+    is flashed to the user and comes back as {}.
+    """
+    results = parse_documents({kind: files_uploaded[kind] for kind in VERIFIED_DOCUMENT_LABELS if kind in files_uploaded})
+    
+    parsed = {}
+    for kind, label in VERIFIED_DOCUMENT_LABELS.items():
+        result = results.get(kind, {})
+        if isinstance(result, Exception):
+            flash(f"Error parsing {label}: {str(result)}", "error")
+            result = {}
+        parsed[kind] = result
+    
+    return parsed['cibil'], parsed['bank'], parsed['upi'], parsed['salary']
+
 @app.route("/process-verified-score")
+@require_role("user")
 def process_verified_score():
     """
     OPTIMIZED Verified Score Processing Pipeline
@@ -1352,144 +1922,115 @@ def process_verified_score():
     - File content hashing for accurate caching
     - Gemini Pro for scoring only
     """
-    if "user_id" not in session or session.get("role") != "user":
-        return redirect(url_for("signin"))
     
-    if "verified_files" not in session:
+    verified_upload = load_pending("verified_files")
+    if verified_upload is None:
         flash("Please upload documents first.", "error")
         return redirect(url_for("verified_score_upload"))
     
-    files_uploaded = session["verified_files"]
+    files_uploaded = verified_upload["files"]
     
-    # STEP 1: Calculate document hash BEFORE parsing (for accurate caching)
-    doc_hash = hash_documents(files_uploaded)
+    # STEP 1: Document hash BEFORE parsing (for accurate caching) - computed at upload time
+    doc_hash = verified_upload.get("doc_hash") or calculate_doc_hash(files_uploaded)
     
     # STEP 2: Check cache first (fast path)
-    with get_db(app) as conn:
-        cached_score = check_cache(conn, session["user_id"], doc_hash)
-        
-        if cached_score:
-            # Use cached score - NO processing needed
-            flash("Using cached verified score (documents unchanged).", "info")
-            behavior_json = json.loads(cached_score["behavior_json"])
-            hybrid_score = cached_score["hybrid_score"]
-            risk_tier = cached_score.get("risk_tier")
-            affordability_json = json.loads(cached_score["affordability_json"]) if cached_score.get("affordability_json") else None
-            interest_rate_json = json.loads(cached_score["interest_rate_json"]) if cached_score.get("interest_rate_json") else None
-            improvement_plan_json = json.loads(cached_score["improvement_plan_json"]) if cached_score.get("improvement_plan_json") else None
-            cibil_json = json.loads(cached_score["cibil_json"]) if cached_score["cibil_json"] else {}
-            bank_json = json.loads(cached_score["bank_json"]) if cached_score["bank_json"] else {}
-            upi_json = json.loads(cached_score["upi_json"]) if cached_score["upi_json"] else {}
-            salary_json = json.loads(cached_score["salary_json"]) if cached_score["salary_json"] else {}
-        else:
-            # STEP 3: Parse documents locally (FAST - no LLM calls)
-            cibil_json = {}
-            bank_json = {}
-            upi_json = {}
-            salary_json = {}
-            
-            if 'cibil' in files_uploaded:
-                try:
-                    cibil_json = parse_cibil_report_optimized(files_uploaded['cibil'])
-                except Exception as e:
-                    flash(f"Error parsing CIBIL report: {str(e)}", "error")
-                    cibil_json = {}
+    # The uploads are deleted however this ends - the pending row is the only record of their paths
+    try:
+        with get_db(app) as conn:
+            cached_score = check_cache(conn, g.actor_id, doc_hash)
+        
+            if cached_score:
+                # Use cached score - NO processing needed
+                flash("Using cached verified score (documents unchanged).", "info")
+                blobs = load_json_columns(cached_score, SCORE_DOCUMENT_COLUMNS + SCORE_DERIVED_COLUMNS)
+                behavior_json = blobs["behavior_json"] or {}
+                hybrid_score = cached_score["hybrid_score"]
+                risk_tier = cached_score.get("risk_tier")
+                affordability_json = blobs["affordability_json"]
+                interest_rate_json = blobs["interest_rate_json"]
+                improvement_plan_json = blobs["improvement_plan_json"]
+                cibil_json = blobs["cibil_json"] or {}
+                bank_json = blobs["bank_json"] or {}
+                upi_json = blobs["upi_json"] or {}
+                salary_json = blobs["salary_json"] or {}
+            else:
+                # STEP 3: Parse documents locally (FAST - no LLM calls), unless these exact files
+                # were already parsed for an earlier verified score (any user)
+                parsed = find_parsed_documents(conn, doc_hash)
+                if parsed:
+                    cibil_json = parsed["cibil_json"]
+                    bank_json = parsed["bank_json"]
+                    upi_json = parsed["upi_json"]
+                    salary_json = parsed["salary_json"]
+                else:
+                    cibil_json, bank_json, upi_json, salary_json = parse_verified_documents(files_uploaded)
             
-            if 'bank' in files_uploaded:
-                try:
-                    bank_json = parse_bank_statement_optimized(files_uploaded['bank'])
-                except Exception as e:
-                    flash(f"Error parsing bank statement: {str(e)}", "error")
-                    bank_json = {}
+                # STEP 4: Build structured dataset (ONLY key metrics)
+                dataset = build_verified_dataset(
+                    bank_data=bank_json,
+                    upi_data=upi_json,
+                    credit_bureau_data=cibil_json,
+                    salary_data=salary_json
+                )
             
-            if 'upi' in files_uploaded:
-                try:
-                    if files_uploaded['upi'].endswith('.csv'):
-                        upi_json = parse_upi_csv_optimized(files_uploaded['upi'])
-                    else:
-                        upi_json = parse_upi_pdf_optimized(files_uploaded['upi'])
-                except Exception as e:
-                    flash(f"Error parsing UPI statement: {str(e)}", "error")
-                    upi_json = {}
+                # STEP 5: Validate dataset has useful data
+                if not validate_dataset(dataset):
+                    flash("Unable to extract sufficient data from documents. Please ensure documents are clear and complete.", "error")
+                    drop_pending("verified_files")
+                    return redirect(url_for("verified_score_upload"))
             
-            if 'salary' in files_uploaded:
+                # STEP 6: Call Gemini Pro for scoring (ONLY structured JSON sent)
                 try:
-                    salary_json = parse_salary_slip_optimized(files_uploaded['salary'])
+                    behavior_result = score_verified_dataset(dataset)
                 except Exception as e:
-                    flash(f"Error parsing salary slip: {str(e)}", "error")
-                    salary_json = {}
-            
-            # STEP 4: Build structured dataset (ONLY key metrics)
-            dataset = build_verified_dataset(
-                bank_data=bank_json,
-                upi_data=upi_json,
-                credit_bureau_data=cibil_json,
-                salary_data=salary_json
-            )
-            
-            # STEP 5: Validate dataset has useful data
-            if not validate_dataset(dataset):
-                flash("Unable to extract sufficient data from documents. Please ensure documents are clear and complete.", "error")
-                session.pop("verified_files", None)
-                return redirect(url_for("verified_score_upload"))
-            
-            # STEP 6: Call Gemini Pro for scoring (ONLY structured JSON sent)
-            try:
-                behavior_result = call_gemini_pro_for_scoring(dataset)
-            except Exception as e:
-                flash(f"Error calculating score: {str(e)}", "error")
-                session.pop("verified_files", None)
-                return redirect(url_for("verified_score_upload"))
+                    print(f"Verified scoring error: {e}")
+                    flash("Error calculating score. Please try again later.", "error")
+                    drop_pending("verified_files")
+                    return redirect(url_for("verified_score_upload"))
             
-            behavior_score = behavior_result.get("behavior_score", 7.0)
-            cibil_score = cibil_json.get("cibil_score")
-            hybrid_score = calculate_hybrid_score(cibil_score, behavior_score)
-            behavior_json = behavior_result
-
-            # STEP 6.5: Compute derived fintech features (NO LLM)
-            risk_info = compute_risk_tier(hybrid_score)
-            risk_tier = risk_info["tier"]
-
-            # Use loan_type if user has a pending request; else default to 'personal'
-            cur = conn.execute(
-                "SELECT loan_type FROM loan_requests WHERE user_id = ? AND status = 'pending' ORDER BY created_at DESC LIMIT 1",
-                (session["user_id"],),
-            )
-            pending_req = cur.fetchone()
-            loan_type_for_calc = (pending_req["loan_type"] if pending_req else "personal") or "personal"
+                behavior_score = behavior_result.get("behavior_score", 7.0)
+                cibil_score = cibil_json.get("cibil_score")
+                hybrid_score = calculate_hybrid_score(cibil_score, behavior_score)
+                behavior_json = behavior_result
 
-            interest_rate_json = recommend_interest_rate_range(risk_tier, loan_type_for_calc, hybrid_score)
-            apr_mid = (interest_rate_json["apr_percent_range"]["min"] + interest_rate_json["apr_percent_range"]["max"]) / 2.0
-            affordability_json = estimate_affordability(dataset, risk_tier, loan_type_for_calc, apr_mid)
-            improvement_plan_json = generate_improvement_plan(dataset, behavior_json)
+                # STEP 6.5: Compute derived fintech features (NO LLM)
+                risk_info = compute_risk_tier(hybrid_score)
+                risk_tier = risk_info["tier"]
+
+                # Use loan_type if user has a pending request; else default to 'personal'
+                cur = conn.execute(
+                    "SELECT loan_type FROM loan_requests WHERE user_id = ? AND status = 'pending' ORDER BY created_at DESC LIMIT 1",
+                    (g.actor_id,),
+                )
+                pending_req = cur.fetchone()
+                loan_type_for_calc = (pending_req["loan_type"] if pending_req else "personal") or "personal"
+
+                interest_rate_json = recommend_interest_rate_range(risk_tier, loan_type_for_calc, hybrid_score)
+                apr_mid = (interest_rate_json["apr_percent_range"]["min"] + interest_rate_json["apr_percent_range"]["max"]) / 2.0
+                affordability_json = estimate_affordability(dataset, risk_tier, loan_type_for_calc, apr_mid)
+                improvement_plan_json = generate_improvement_plan(dataset, behavior_json)
             
-            # STEP 7: Save to database with caching
-            save_verified_score(
-                conn,
-                session["user_id"],
-                doc_hash,
-                cibil_json,
-                bank_json,
-                upi_json,
-                salary_json,
-                behavior_json,
-                hybrid_score,
-                risk_tier=risk_tier,
-                affordability_json=affordability_json,
-                interest_rate_json=interest_rate_json,
-                improvement_plan_json=improvement_plan_json,
-            )
-        
-        # Clean up uploaded files
-        for file_path in files_uploaded.values():
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            except:
-                pass
+                # STEP 7: Save to database with caching
+                save_verified_score(
+                    conn,
+                    g.actor_id,
+                    doc_hash,
+                    cibil_json,
+                    bank_json,
+                    upi_json,
+                    salary_json,
+                    behavior_json,
+                    hybrid_score,
+                    risk_tier=risk_tier,
+                    affordability_json=affordability_json,
+                    interest_rate_json=interest_rate_json,
+                    improvement_plan_json=improvement_plan_json,
+                )
+    finally:
+        remove_uploads(verified_upload)
     
-    # Store in session for result page
-    session["result"] = {
+    # Store for result page
+    stash_pending("result", {
         "cibil_json": cibil_json,
         "bank_json": bank_json,
         "upi_json": upi_json,
@@ -1502,18 +2043,17 @@ def process_verified_score():
         "interest_rate": interest_rate_json if "interest_rate_json" in locals() else None,
         "improvement_plan": improvement_plan_json if "improvement_plan_json" in locals() else None,
         "score_type": "verified"
-    }
+    })
     
-    # Clear session data
-    session.pop("verified_files", None)
+    # Clear flow data
+    drop_pending("verified_files")
     
     return redirect(url_for("result"))
 
 @app.route("/request-loan", methods=["POST"])
+@require_role("user", api=True)
 def request_loan():
     """User requests a loan"""
-    if "user_id" not in session or session.get("role") != "user":
-        return jsonify({"error": "Unauthorized"}), 401
     
     loan_type = request.form.get("loan_type")
     if not loan_type or loan_type not in LOAN_TYPES:
@@ -1523,25 +2063,25 @@ def request_loan():
     with get_db(app) as conn:
         conn.execute(
             "INSERT INTO loan_requests (user_id, loan_type, status) VALUES (?, ?, ?)",
-            (session["user_id"], loan_type, "pending")
+            (g.actor_id, loan_type, "pending")
         )
     
     flash(f"Loan request for {loan_type} loan submitted successfully!", "success")
     return redirect(url_for("dashboard"))
 
 @app.route("/lender/dashboard")
+@require_role("lender")
 def lender_dashboard():
     """Lender dashboard"""
-    if "lender_id" not in session or session.get("role") != "lender":
-        return redirect(url_for("signin"))
     
     with get_db(app) as conn:
         # Get lender info
         cur = conn.execute(
-            "SELECT unique_lender_id, org_name, loan_types_offered FROM lenders WHERE id = ?",
-            (session["lender_id"],)
+            "SELECT unique_lender_id, org_name FROM lenders WHERE id = ?",
+            (g.actor_id,)
         )
         lender = cur.fetchone()
+        loan_types_offered = cached_lender_loan_types(conn, g.actor_id)
         
         # Get pending loan requests
         cur = conn.execute(
@@ -1553,46 +2093,32 @@ def lender_dashboard():
         )
         pending_requests = cur.fetchall()
         
-        # Get approved loans history (loans approved by this lender)
+        # Get approved loans history (loans approved by this lender).
+        # SQLite pulls the notes out of decision_json - the template needs nothing else from it
         cur = conn.execute(
-            """SELECT lr.id, lr.user_id, lr.loan_type, lr.status, lr.decision_json, lr.created_at, 
+            """SELECT lr.id, lr.user_id, lr.loan_type, lr.status, lr.created_at,
+                      CASE WHEN json_valid(lr.decision_json)
+                           THEN json_extract(lr.decision_json, '$.notes') END AS decision_notes,
                       u.unique_user_id, u.username
                FROM loan_requests lr
                JOIN users u ON lr.user_id = u.id
                WHERE lr.lender_id = ? AND lr.status = 'approved'
                ORDER BY lr.created_at DESC LIMIT 50""",
-            (session["lender_id"],)
+            (g.actor_id,)
         )
-        approved_loans_raw = cur.fetchall()
-        
-        # Parse decision_json for each loan
-        approved_loans = []
-        for loan in approved_loans_raw:
-            loan_dict = dict(loan)
-            if loan_dict["decision_json"]:
-                try:
-                    loan_dict["decision"] = json.loads(loan_dict["decision_json"])
-                except:
-                    loan_dict["decision"] = None
-            else:
-                loan_dict["decision"] = None
-            approved_loans.append(loan_dict)
-    
-    loan_types_offered = json.loads(lender["loan_types_offered"]) if lender["loan_types_offered"] else []
+        approved_loans = cur.fetchall()
     
     return render_template("lender_dashboard.html",
                          lender_id=lender["unique_lender_id"],
                          org_name=lender["org_name"],
                          loan_types_offered=loan_types_offered,
                          pending_requests=pending_requests,
-                         approved_loans=approved_loans,
-                         loan_types=LOAN_TYPES)
+                         approved_loans=approved_loans)
 
 @app.route("/lender/search-user", methods=["GET", "POST"])
+@require_role("lender")
 def lender_search_user():
     """Lender searches for user by unique ID"""
-    if "lender_id" not in session or session.get("role") != "lender":
-        return redirect(url_for("signin"))
     
     # Handle GET request with user_id parameter (from pending requests / deep links)
     if request.method == "GET":
@@ -1603,87 +2129,46 @@ def lender_search_user():
             loan_type = request.args.get("loan_type", "") or None
 
             with get_db(app) as conn:
-                # Find user
-                cur = conn.execute(
-                    "SELECT id, username, unique_user_id FROM users WHERE unique_user_id = ?",
-                    (unique_user_id,),
-                )
-                user = cur.fetchone()
-                if not user:
-                    flash("User not found.", "error")
-                    return redirect(url_for("lender_search_user"))
-
-                # If a request_id is provided, load the loan request so the lender can approve/reject.
-                loan_request = None
-                if request_id:
-                    cur = conn.execute("SELECT * FROM loan_requests WHERE id = ?", (request_id,))
-                    loan_request = cur.fetchone()
-                    if loan_request and loan_request["loan_type"]:
-                        loan_type = loan_request["loan_type"]
-
-                # If no explicit request_id, try to load the user's latest pending loan request
-                # (so the lender still sees an approve/reject option after searching).
-                if not loan_request:
-                    cur = conn.execute(
-                        """SELECT * FROM loan_requests
-                           WHERE user_id = ? AND status = 'pending'
-                           ORDER BY created_at DESC LIMIT 1""",
-                        (user["id"],),
-                    )
-                    loan_request = cur.fetchone()
-                    if loan_request and loan_request["loan_type"] and not loan_type:
-                        loan_type = loan_request["loan_type"]
+                # Find user, their latest pending loan request, the request_id one (if given, so the
+                # lender can approve/reject), lender info and the latest verified score
+                score_view = fetch_lender_score_view(conn, unique_user_id, request_id or None, g.actor_id)
+                if not score_view:
+                    return render_template("lender_search_user.html", user_info=None, error="User not found."), 404
+                user, loan_request, lender_info, verified_score = score_view
 
-                # Get verified score
-                cur = conn.execute(
-                    "SELECT * FROM verified_scores WHERE user_id = ? ORDER BY created_at DESC LIMIT 1",
-                    (user["id"],),
-                )
-                verified_score = cur.fetchone()
+                if loan_request and loan_request["loan_type"]:
+                    loan_type = loan_request["loan_type"]
+
+                # If no explicit request_id, fall back to the user's latest pending loan request
+                # (so the lender still sees an approve/reject option after searching).
+                if not loan_request and user["request_id"]:
+                    loan_request = {"id": user["request_id"], "loan_type": user["loan_type"]}
+                    if user["loan_type"] and not loan_type:
+                        loan_type = user["loan_type"]
 
                 if not verified_score:
                     # Send notification to user
                     lender_name = session.get("username", "A lender")
                     conn.execute(
-                        """INSERT INTO notifications (user_id, lender_id, notification_type, message)
-                           VALUES (?, ?, ?, ?)""",
+                        INSERT_NOTIFICATION_SQL,
                         (
                             user["id"],
-                            session["lender_id"],
+                            g.actor_id,
                             "score_request",
                             f"{lender_name} tried to check your verified score, but you haven't generated one yet. Please upload your official documents to generate your verified score.",
                         ),
                     )
-                    conn.commit()
 
                     # Send WhatsApp notification
-                    cur = conn.execute("SELECT phone FROM users WHERE id = ?", (user["id"],))
-                    user_phone = cur.fetchone()
-                    if user_phone and user_phone["phone"]:
-                        cur = conn.execute(
-                            "SELECT name, org_name FROM lenders WHERE id = ?",
-                            (session["lender_id"],),
-                        )
-                        lender_info = cur.fetchone()
-                        lender_org = (
-                            lender_info["org_name"]
-                            if lender_info and lender_info["org_name"]
-                            else lender_name
-                        )
+                    if user["phone"]:
+                        lender_org = lender_info["org_name"] or lender_name
                         whatsapp_message = (
                             "🔔 InsightScore Alert: "
                             f"{lender_org} tried to check your verified credit score, but you haven't generated one yet. "
                             "Please upload your official documents (Bank statement, UPI transactions, CIBIL report) to generate your verified score. "
                             "Visit your dashboard to upload documents now!"
                         )
-                        send_whatsapp_message(user_phone["phone"], whatsapp_message)
-
-                    # Get lender info for display
-                    cur = conn.execute(
-                        "SELECT name, org_name FROM lenders WHERE id = ?",
-                        (session["lender_id"],),
-                    )
-                    lender_info = cur.fetchone()
+                        queue_whatsapp_message(user["phone"], whatsapp_message)
 
                     return render_template(
                         "lender_user_no_score.html",
@@ -1691,35 +2176,31 @@ def lender_search_user():
                         lender_info=lender_info,
                         loan_type=loan_type,
                         request_id=(loan_request["id"] if loan_request else request_id),
-                        loan_types=LOAN_TYPES,
                     )
 
-                # Parse verified score data
-                cibil_json = json.loads(verified_score["cibil_json"]) if verified_score["cibil_json"] else {}
-                bank_json = json.loads(verified_score["bank_json"]) if verified_score["bank_json"] else {}
-                upi_json = json.loads(verified_score["upi_json"]) if verified_score["upi_json"] else {}
-                salary_json = json.loads(verified_score["salary_json"]) if verified_score["salary_json"] else {}
-                behavior_json = json.loads(verified_score["behavior_json"]) if verified_score["behavior_json"] else {}
-
-                # Derived fintech fields (may be missing for older rows)
-                risk_tier = verified_score["risk_tier"] if "risk_tier" in verified_score.keys() else None
-                affordability = None
-                interest_rate = None
-                improvement_plan = None
-                try:
-                    affordability = json.loads(verified_score["affordability_json"]) if verified_score.get("affordability_json") else None
-                except Exception:
-                    affordability = None
-                try:
-                    interest_rate = json.loads(verified_score["interest_rate_json"]) if verified_score.get("interest_rate_json") else None
-                except Exception:
-                    interest_rate = None
-                try:
-                    improvement_plan = json.loads(verified_score["improvement_plan_json"]) if verified_score.get("improvement_plan_json") else None
-                except Exception:
-                    improvement_plan = None
+                # Verified scores are never updated (a rescore inserts a new row), so the row id and the
+                # request context identify the page; a refresh of an unchanged page skips all JSON parsing
+                etag = score_view_etag(
+                    g.actor_id, tuple(user.values()), verified_score["id"], loan_type,
+                    loan_request["id"] if loan_request else None,
+                )
+                if etag in request.if_none_match:
+                    return private_page(app.response_class(status=304), etag)
+
+                # Parse the verified score data the page shows (and the derived fintech fields, which may
+                # be missing for older rows). UPI data is only needed to recompute those fields
+                blobs = load_json_columns(verified_score, LENDER_VIEW_COLUMNS + SCORE_DERIVED_COLUMNS)
+                cibil_json = blobs["cibil_json"] or {}
+                bank_json = blobs["bank_json"] or {}
+                salary_json = blobs["salary_json"] or {}
+                behavior_json = blobs["behavior_json"] or {}
+                risk_tier = verified_score["risk_tier"]  # init_db adds the column to older databases
+                affordability = blobs["affordability_json"]
+                interest_rate = blobs["interest_rate_json"]
+                improvement_plan = blobs["improvement_plan_json"]
 
                 if not risk_tier or not affordability or not interest_rate:
+                    upi_json = load_json_columns(verified_score, ("upi_json",))["upi_json"] or {}
                     dataset = build_verified_dataset(
                         bank_data=bank_json,
                         upi_data=upi_json,
@@ -1737,16 +2218,18 @@ def lender_search_user():
                 loan_decision = None
                 if loan_type:
                     loan_decision = calculate_loan_type_score(
-                        behavior_json, loan_type, cibil_json.get("cibil_score"), salary_json
+                        loan_type,
+                        cibil_json.get("cibil_score"),
+                        behavior_json.get("behavior_score", 7.0),
+                        salary_json.get("gross_salary") or salary_json.get("net_salary"),
                     )
 
-                return render_template(
+                return private_page(make_response(render_template(
                     "lender_user_score.html",
                     user=user,
                     verified_score=verified_score,
                     cibil_json=cibil_json,
                     bank_json=bank_json,
-                    upi_json=upi_json,
                     salary_json=salary_json,
                     behavior_json=behavior_json,
                     loan_type=loan_type,
@@ -1756,52 +2239,25 @@ def lender_search_user():
                     affordability=affordability,
                     interest_rate=interest_rate,
                     improvement_plan=improvement_plan,
-                    loan_types=LOAN_TYPES,
-                )
+                )), etag)
     
     if request.method == "POST":
-        unique_user_id = request.form.get("unique_user_id", "").strip().upper()
+        unique_user_id = form_text("unique_user_id").upper()
         
         if not unique_user_id:
-            flash("Please enter a user ID.", "error")
-            return redirect(url_for("lender_search_user"))
+            return render_template("lender_search_user.html", user_info=None, error="Please enter a user ID."), 400
         
         with get_db(app) as conn:
-            # Find user
-            cur = conn.execute(
-                "SELECT id, username, unique_user_id FROM users WHERE unique_user_id = ?",
-                (unique_user_id,)
-            )
-            user = cur.fetchone()
-            
-            if not user:
-                flash("User not found.", "error")
-                return redirect(url_for("lender_search_user"))
-            
-            # Get user's pending loan request to show loan type
-            cur = conn.execute(
-                """SELECT loan_type, id FROM loan_requests 
-                   WHERE user_id = ? AND status = 'pending' 
-                   ORDER BY created_at DESC LIMIT 1""",
-                (user["id"],)
-            )
-            loan_request = cur.fetchone()
-            loan_type = loan_request["loan_type"] if loan_request else None
-            request_id = loan_request["id"] if loan_request else None
-            
-            # Prepare user info for display
-            user_info = {
-                "id": user["id"],
-                "username": user["username"],
-                "unique_user_id": user["unique_user_id"],
-                "loan_type": loan_type,
-                "request_id": request_id
-            }
-            
-            # Show user profile card first (with loan type if they have a pending request)
-            return render_template("lender_search_user.html",
-                                 loan_types=LOAN_TYPES,
-                                 user_info=user_info)
+            # Find user with the loan type of their pending request, if any
+            user_info = fetch_user_with_pending_loan(conn, unique_user_id)
+        
+        if not user_info:
+            # Rendered in place rather than flash + redirect, which would cost the browser a second request
+            return render_template("lender_search_user.html", user_info=None, error="User not found."), 404
+        
+        # Show user profile card first (with loan type if they have a pending request)
+        return render_template("lender_search_user.html",
+                             user_info=user_info)
     
     # Check if user_id is provided in GET request for display
     user_id = request.args.get("user_id")
@@ -1809,118 +2265,129 @@ def lender_search_user():
     
     if user_id:
         with get_db(app) as conn:
-            cur = conn.execute(
-                "SELECT id, username, unique_user_id FROM users WHERE unique_user_id = ?",
-                (user_id.upper(),)
-            )
-            user = cur.fetchone()
-            
-            if user:
-                # Get user's pending loan request to show loan type
-                cur = conn.execute(
-                    """SELECT loan_type, id FROM loan_requests 
-                       WHERE user_id = ? AND status = 'pending' 
-                       ORDER BY created_at DESC LIMIT 1""",
-                    (user["id"],)
-                )
-                loan_request = cur.fetchone()
-                
-                user_info = {
-                    "id": user["id"],
-                    "username": user["username"],
-                    "unique_user_id": user["unique_user_id"],
-                    "loan_type": loan_request["loan_type"] if loan_request else None,
-                    "request_id": loan_request["id"] if loan_request else None
-                }
+            user_info = fetch_user_with_pending_loan(conn, user_id.upper())
     
     return render_template("lender_search_user.html", 
-                         loan_types=LOAN_TYPES,
                          user_info=user_info)
 
 @app.route("/lender/edit-loan-types", methods=["GET", "POST"])
+@require_role("lender")
 def lender_edit_loan_types():
     """Lender edits loan types they offer"""
-    if "lender_id" not in session or session.get("role") != "lender":
-        return redirect(url_for("signin"))
     
     if request.method == "POST":
         loan_types = request.form.getlist("loan_types")
-        loan_types_json = json.dumps(loan_types) if loan_types else "[]"
         
         with get_db(app) as conn:
-            conn.execute(
-                "UPDATE lenders SET loan_types_offered = ? WHERE id = ?",
-                (loan_types_json, session["lender_id"])
-            )
+            conn.execute("BEGIN IMMEDIATE")
+            set_lender_loan_types(conn, g.actor_id, loan_types)
             conn.commit()
+        # Dropped after the commit so a concurrent read cannot re-cache the old list
+        _lender_loan_types_cache.pop(g.actor_id, None)
         
         flash("Loan types updated successfully!", "success")
         return redirect(url_for("lender_dashboard"))
     
     # GET request - show edit form
     with get_db(app) as conn:
-        cur = conn.execute(
-            "SELECT loan_types_offered FROM lenders WHERE id = ?",
-            (session["lender_id"],)
-        )
-        lender = cur.fetchone()
-    
-    current_loan_types = json.loads(lender["loan_types_offered"]) if lender["loan_types_offered"] else []
+        current_loan_types = cached_lender_loan_types(conn, g.actor_id)
     
     return render_template("lender_edit_loan_types.html",
-                         current_loan_types=current_loan_types,
-                         all_loan_types=LOAN_TYPES)
+                         current_loan_types=current_loan_types)
 
 @app.route("/lender/approve-loan/<int:request_id>", methods=["POST"])
+@require_role("lender")
 def lender_approve_loan(request_id):
     """Lender approves a loan request"""
-    if "lender_id" not in session or session.get("role") != "lender":
-        return redirect(url_for("signin"))
     
     decision = request.form.get("decision")  # 'approve' or 'reject'
     notes = request.form.get("notes", "")
     
-    decision_json = {
-        "decision": decision,
-        "notes": notes,
-        "lender_id": session["lender_id"],
-        "decided_at": datetime.now().isoformat()
-    }
-    
     status = "approved" if decision == "approve" else "rejected"
     
     with get_db(app) as conn:
-        conn.execute(
-            """UPDATE loan_requests SET lender_id = ?, status = ?, decision_json = ? WHERE id = ?""",
-            (session["lender_id"], status, json.dumps(decision_json), request_id)
-        )
-        conn.commit()
+        # RETURNING reports the updated request in the same statement - no row means no such request
+        decided = conn.execute(
+            DECIDE_LOAN_REQUEST_SQL,
+            (g.actor_id, status, decision, notes, g.actor_id, request_id)
+        ).fetchall()
     
-    flash(f"Loan request {status} successfully!", "success")
+    if not decided:
+        flash("Loan request not found.", "error")
+    else:
+        loan_type = decided[0]["loan_type"]
+        flash(f"{loan_type.title() + ' loan' if loan_type else 'Loan'} request {status} successfully!", "success")
     return redirect(url_for("lender_dashboard"))
 
 @app.route("/notifications/mark-read/<int:notification_id>", methods=["POST"])
+@require_role("user", api=True)
 def mark_notification_read(notification_id):
     """Mark a notification as read"""
-    if "user_id" not in session or session.get("role") != "user":
-        return jsonify({"error": "Unauthorized"}), 401
     
     with get_db(app) as conn:
-        conn.execute(
-            "UPDATE notifications SET is_read = 1 WHERE id = ? AND user_id = ?",
-            (notification_id, session["user_id"])
+        # Already-read (or someone else's) notifications match no row, so nothing is written
+        cur = conn.execute(
+            "UPDATE notifications SET is_read = 1 WHERE id = ? AND user_id = ? AND is_read = 0",
+            (notification_id, g.actor_id)
         )
-        conn.commit()
     
-    return jsonify({"success": True})
+    return jsonify({"success": True, "changed": cur.rowcount > 0})
+
+@app.route("/notifications/mark-read-batch", methods=["POST"])
+@require_role("user", api=True)
+def mark_notifications_read_batch():
+    """Mark several notifications as read in one request (JSON body: {"ids": [...]})"""
+    payload = request.get_json(silent=True) or {}
+    ids = payload.get("ids")
+    if (not isinstance(ids, list) or len(ids) > MAX_MARK_READ_BATCH
+            or not all(type(i) is int for i in ids)):
+        return jsonify({"error": f"ids must be a list of at most {MAX_MARK_READ_BATCH} notification ids"}), 400
+    if not ids:
+        return jsonify({"success": True, "count": 0})
+    
+    with get_db(app) as conn:
+        cur = conn.execute(MARK_NOTIFICATIONS_READ_SQL, (g.actor_id, dump_json(ids)))
+    
+    return jsonify({"success": True, "count": cur.rowcount})
 
 @app.route("/logout")
 def logout():
     """User/Lender logout"""
+    if "user_id" in session:
+        with get_db(app) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            uploads = conn.execute(
+                "SELECT payload FROM pending WHERE user_id = ? AND kind = 'verified_files'",
+                (session["user_id"],)
+            ).fetchall()
+            conn.execute("DELETE FROM pending WHERE user_id = ?", (session["user_id"],))
+        for row in uploads:
+            remove_uploads(load_json(row["payload"]))
     session.clear()
     flash("Signed out successfully.", "success")
     return redirect(url_for("signin"))
 
+@app.cli.command("send-reminders")
+def send_reminders_command():
+    """Send monthly Quick Score reminders to all due users (run from cron)"""
+    with get_db(app) as conn:
+        sent = check_monthly_reminders_bulk(conn)
+    print(f"Sent {sent} reminder(s)")
+
+@app.cli.command("purge-pending")
+def purge_pending_command():
+    """Delete flow data (and uploaded documents) left behind by abandoned flows, and expired UPI parses (run from cron)"""
+    age = f"-{PENDING_MAX_AGE_HOURS} hours"
+    with get_db(app) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        stale_uploads = conn.execute(STALE_PENDING_UPLOADS_SQL, (age,)).fetchall()
+        purged = conn.execute(DELETE_STALE_PENDING_SQL, (age,)).rowcount
+        conn.execute(DELETE_STALE_UPI_PARSES_SQL, (f"-{UPI_PARSE_CACHE_MAX_AGE_DAYS} days",))
+    
+    for row in stale_uploads:
+        remove_uploads(load_json(row["payload"]))
+    print(f"Purged {purged} stale pending row(s)")
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     debug_mode = os.environ.get("SECRET_KEY") is None
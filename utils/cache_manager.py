@@ -4,7 +4,13 @@ Hashes actual file content (not JSON) for accurate caching
 """
 import hashlib
 import os
-from typing import Dict, Optional, List
+from typing import BinaryIO, Dict, Optional, List
+
+from utils.json_codec import dumps, loads
+
+
+# Files are hashed in 1MB chunks so large uploads are never held in memory
+HASH_CHUNK_SIZE = 1024 * 1024
 
 
 def hash_file_content(file_path: str) -> str:
@@ -13,14 +19,50 @@ def hash_file_content(file_path: str) -> str:
     Used for caching - same files = same hash = cached score.
     """
     try:
+        file_hash = hashlib.sha256()
         with open(file_path, 'rb') as f:
-            file_hash = hashlib.sha256(f.read()).hexdigest()
-        return file_hash
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
     except Exception as e:
         print(f"Error hashing file {file_path}: {e}")
         return ""
 
 
+def save_and_hash(stream: BinaryIO, out: BinaryIO) -> str:
+    """
+    Copy stream to out in HASH_CHUNK_SIZE chunks, hashing the bytes as they pass.
+    Returns the SHA256 of the content, so a freshly saved upload never has to be re-read to hash it.
+    """
+    file_hash = hashlib.sha256()
+    while chunk := stream.read(HASH_CHUNK_SIZE):
+        file_hash.update(chunk)
+        out.write(chunk)
+    return file_hash.hexdigest()
+
+
+def hash_stream(stream: BinaryIO) -> str:
+    """
+    SHA256 of a seekable stream's content, read in HASH_CHUNK_SIZE chunks.
+    The stream is rewound afterwards so it can still be parsed.
+    """
+    file_hash = hashlib.sha256()
+    while chunk := stream.read(HASH_CHUNK_SIZE):
+        file_hash.update(chunk)
+    stream.seek(0)
+    return file_hash.hexdigest()
+
+
+def combine_document_hashes(file_hashes: Dict[str, str]) -> str:
+    """
+    Combine per-document content hashes into one document-set hash.
+    Gives the same result as hash_documents for the same files.
+    """
+    # Sort keys for consistent hashing
+    combined = "|".join(f"{key}:{file_hashes[key]}" for key in sorted(file_hashes) if file_hashes[key])
+    return hashlib.sha256(combined.encode()).hexdigest()
+
+
 def hash_documents(files_dict: Dict[str, str]) -> str:
     """
     Calculate combined hash of all uploaded documents.
@@ -33,19 +75,92 @@ def hash_documents(files_dict: Dict[str, str]) -> str:
     Returns:
         SHA256 hash string
     """
-    hashes = []
+    file_hashes = {
+        key: hash_file_content(file_path)
+        for key, file_path in files_dict.items()
+        if file_path and os.path.exists(file_path)
+    }
+    return combine_document_hashes(file_hashes)
+
+
+def hash_prompt(prompt: str, model_name: str) -> str:
+    """
+    Calculate SHA256 hash of an LLM prompt for response caching.
+    The model name is part of the key so a model switch never replays old output.
+    """
+    return hashlib.sha256(f"{prompt}|{model_name}".encode()).hexdigest()
+
+
+def get_cached_llm_response(conn, key: str) -> Optional[Dict]:
+    """
+    Look up a previously stored LLM response by prompt hash.
     
-    # Sort keys for consistent hashing
-    for key in sorted(files_dict.keys()):
-        file_path = files_dict[key]
-        if file_path and os.path.exists(file_path):
-            file_hash = hash_file_content(file_path)
-            if file_hash:
-                hashes.append(f"{key}:{file_hash}")
+    Returns:
+        Parsed response if found, None otherwise
+    """
+    try:
+        cur = conn.execute("SELECT response_json FROM llm_cache WHERE key = ?", (key,))
+        cached = cur.fetchone()
+        return loads(cached[0]) if cached else None
+    except Exception as e:
+        print(f"LLM cache lookup error: {e}")
+        return None
+
+
+def save_llm_response(conn, key: str, response: Dict) -> bool:
+    """
+    Store a parsed LLM response under its prompt hash.
     
-    # Combine all hashes
-    combined = "|".join(hashes)
-    return hashlib.sha256(combined.encode()).hexdigest()
+    Returns:
+        True if saved successfully, False otherwise
+    """
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, response_json) VALUES (?, ?)",
+            (key, dumps(response))
+        )
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Error saving LLM response: {e}")
+        conn.rollback()
+        return False
+
+
+def get_cached_upi_parse(conn, key: str) -> Optional[Dict]:
+    """
+    Look up a previously parsed Quick Score UPI statement by file type and content hash.
+    
+    Returns:
+        Parsed UPI data if found, None otherwise
+    """
+    try:
+        cur = conn.execute("SELECT parsed_json FROM upi_parse_cache WHERE key = ?", (key,))
+        cached = cur.fetchone()
+        return loads(cached[0]) if cached else None
+    except Exception as e:
+        print(f"UPI parse cache lookup error: {e}")
+        return None
+
+
+def save_upi_parse(conn, key: str, parsed: Dict) -> bool:
+    """
+    Store parsed Quick Score UPI data under its file type and content hash.
+    
+    Returns:
+        True if saved successfully, False otherwise
+    """
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO upi_parse_cache (key, parsed_json) VALUES (?, ?)",
+            (key, dumps(parsed))
+        )
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Error saving UPI parse: {e}")
+        conn.rollback()
+        return False
 
 
 def check_cache(conn, user_id: str, doc_hash: str) -> Optional[Dict]:
@@ -87,6 +202,29 @@ def check_cache(conn, user_id: str, doc_hash: str) -> Optional[Dict]:
         return None
 
 
+def find_parsed_documents(conn, doc_hash: str) -> Optional[Dict]:
+    """
+    Look up the parsed document JSON of any earlier verified score with this document hash.
+    Parsing depends only on the file bytes, so identical uploads - from any user - can reuse it.
+    
+    Returns:
+        Dict with cibil_json/bank_json/upi_json/salary_json if found, None otherwise
+    """
+    try:
+        cur = conn.execute(
+            """SELECT cibil_json, bank_json, upi_json, salary_json FROM verified_scores
+               WHERE doc_hash = ? ORDER BY id DESC LIMIT 1""",
+            (doc_hash,)
+        )
+        cached = cur.fetchone()
+        if cached:
+            return {key: loads(cached[key]) if cached[key] else {} for key in cached.keys()}
+        return None
+    except Exception as e:
+        print(f"Parsed document lookup error: {e}")
+        return None
+
+
 def save_verified_score(
     conn,
     user_id: str,
@@ -109,7 +247,6 @@ def save_verified_score(
         True if saved successfully, False otherwise
     """
     try:
-        import json
         conn.execute(
             """INSERT INTO verified_scores 
                (user_id, cibil_json, bank_json, upi_json, salary_json, behavior_json, hybrid_score,
@@ -117,16 +254,16 @@ def save_verified_score(
                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (
                 user_id,
-                json.dumps(cibil_json),
-                json.dumps(bank_json),
-                json.dumps(upi_json),
-                json.dumps(salary_json),
-                json.dumps(behavior_json),
+                dumps(cibil_json),
+                dumps(bank_json),
+                dumps(upi_json),
+                dumps(salary_json),
+                dumps(behavior_json),
                 hybrid_score,
                 risk_tier,
-                json.dumps(affordability_json) if affordability_json is not None else None,
-                json.dumps(interest_rate_json) if interest_rate_json is not None else None,
-                json.dumps(improvement_plan_json) if improvement_plan_json is not None else None,
+                dumps(affordability_json) if affordability_json is not None else None,
+                dumps(interest_rate_json) if interest_rate_json is not None else None,
+                dumps(improvement_plan_json) if improvement_plan_json is not None else None,
                 doc_hash
             )
         )
@@ -3,11 +3,68 @@ Optimized Gemini LLM Processor
 Uses Gemini Flash for extraction, Gemini Pro for scoring
 Only sends structured JSON - NO raw text
 """
+import copy
 import json
 import re
 import google.generativeai as genai
 from typing import Dict, Optional
 
+from utils.json_codec import loads
+from utils.llm_throttle import generate_content
+
+
+# Built once per process; the SDK creates its API client lazily on first call and
+# shares it across models, so the connection is reused for every request.
+# Both the extraction and scoring calls expect JSON, so ask for it directly.
+GEMINI_MODEL_NAME = 'gemini-2.0-flash-exp'
+gemini_model = genai.GenerativeModel(
+    GEMINI_MODEL_NAME,
+    generation_config={"response_mime_type": "application/json"},
+)
+
+# Safety net for responses that wrap the JSON object in prose or code fences
+LLM_JSON_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+# Returned (as a copy) whenever scoring cannot produce a result
+FALLBACK_SCORE = {
+    "income_stability_score": 7.0,
+    "spending_discipline_score": 7.0,
+    "savings_behavior_score": 7.0,
+    "payment_discipline_score": 7.0,
+    "digital_behavior_score": 7.0,
+    "lifestyle_stability_score": 7.0,
+    "behavior_score": 7.0,
+    "explanation": "Based on verified documents, moderate financial behavior observed. Unable to generate detailed analysis.",
+    "key_insights": {
+        "positive": [],
+        "negative": []
+    },
+    "red_flags": [],
+    "improvement_tips": [
+        "Maintain consistent savings",
+        "Pay bills on time",
+        "Track expenses regularly"
+    ]
+}
+
+
+def parse_llm_json(response_text: str) -> Optional[Dict]:
+    """
+    Parse a Gemini JSON response.
+    JSON response mode returns the document itself, so it is parsed directly;
+    the regex scan only runs when that fails. Returns None if no JSON object is found.
+    """
+    try:
+        return loads(response_text)
+    except ValueError:
+        pass
+    json_match = LLM_JSON_RE.search(response_text)
+    if json_match:
+        try:
+            return loads(json_match.group())
+        except ValueError:
+            pass
+    return None
 
 def call_gemini_flash_for_extraction(prompt: str, data: Dict) -> Optional[Dict]:
     """
@@ -16,27 +73,19 @@ def call_gemini_flash_for_extraction(prompt: str, data: Dict) -> Optional[Dict]:
     Kept for future use cases.
     """
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        response = model.generate_content(prompt, timeout=10)
-        response_text = response.text.strip()
-        
-        # Extract JSON from response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
-        return None
+        response = generate_content(gemini_model, prompt, request_options={"timeout": 10})
+        return parse_llm_json(response.text)
     except Exception as e:
         print(f"Gemini Flash extraction error: {e}")
         return None
 
 
-def call_gemini_pro_for_scoring(dataset: Dict) -> Dict:
+def build_scoring_prompt(dataset: Dict) -> str:
     """
-    Use Gemini Pro for accurate scoring.
-    Sends ONLY structured JSON - no raw text.
+    Build the strict scoring prompt for a structured dataset.
+    Also used as the cache key input, so identical datasets map to the same prompt.
     """
-    # Build strict prompt with structured data only
-    prompt = f"""
+    return f"""
 You are a financial behavior analyst. Calculate verified behavioral scores based ONLY on the structured JSON data provided below.
 
 IMPORTANT RULES:
@@ -100,18 +149,21 @@ Respond ONLY with valid JSON in this exact format:
   "improvement_tips": ["<tip 1>", "<tip 2>", "<tip 3>"]
 }}
 """
+
+
+def call_gemini_pro_for_scoring(dataset: Dict) -> Dict:
+    """
+    Use Gemini Pro for accurate scoring.
+    Sends ONLY structured JSON - no raw text.
+    """
+    # Build strict prompt with structured data only
+    prompt = build_scoring_prompt(dataset)
     
     try:
         # Use Gemini Pro for accurate scoring
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        response = model.generate_content(prompt, timeout=30)
-        response_text = response.text.strip()
-        
-        # Extract JSON from response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            result = json.loads(json_match.group())
-            
+        response = generate_content(gemini_model, prompt, request_options={"timeout": 30})
+        result = parse_llm_json(response.text)
+        if isinstance(result, dict):
             # Validate scores are in range
             for key in ['income_stability_score', 'spending_discipline_score', 
                        'savings_behavior_score', 'payment_discipline_score',
@@ -131,24 +183,5 @@ Respond ONLY with valid JSON in this exact format:
 
 def get_fallback_score() -> Dict:
     """Fallback scoring if Gemini fails"""
-    return {
-        "income_stability_score": 7.0,
-        "spending_discipline_score": 7.0,
-        "savings_behavior_score": 7.0,
-        "payment_discipline_score": 7.0,
-        "digital_behavior_score": 7.0,
-        "lifestyle_stability_score": 7.0,
-        "behavior_score": 7.0,
-        "explanation": "Based on verified documents, moderate financial behavior observed. Unable to generate detailed analysis.",
-        "key_insights": {
-            "positive": [],
-            "negative": []
-        },
-        "red_flags": [],
-        "improvement_tips": [
-            "Maintain consistent savings",
-            "Pay bills on time",
-            "Track expenses regularly"
-        ]
-    }
+    return copy.deepcopy(FALLBACK_SCORE)
 
@@ -0,0 +1,72 @@
+"""
+Gemini Call Throttling
+Bounds concurrent Gemini calls with a shared thread pool and rate-limits them
+against the API's requests-per-minute and tokens-per-minute quotas
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Quotas - match these to the project's Gemini tier
+GEMINI_MAX_WORKERS = int(os.environ.get("GEMINI_MAX_WORKERS", "8"))
+GEMINI_RPM = int(os.environ.get("GEMINI_RPM", "60"))
+GEMINI_TPM = int(os.environ.get("GEMINI_TPM", "1000000"))
+
+# Rough prompt size estimate (~4 characters per token for English text)
+CHARS_PER_TOKEN = 4
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at rate_per_minute.
+    acquire() blocks until enough tokens are available.
+    """
+
+    def __init__(self, rate_per_minute: int, capacity: int = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: int = 1) -> None:
+        # Requests larger than the bucket would wait forever; let them drain it instead
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate_per_second
+            time.sleep(wait)
+
+
+_executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_WORKERS, thread_name_prefix="gemini")
+_request_bucket = TokenBucket(GEMINI_RPM)
+_token_bucket = TokenBucket(GEMINI_TPM)
+
+
+def estimate_tokens(prompt: str) -> int:
+    """Estimate the input token count of a prompt"""
+    return max(1, len(prompt) // CHARS_PER_TOKEN)
+
+
+def _throttled_generate(model, prompt, kwargs):
+    _request_bucket.acquire()
+    _token_bucket.acquire(estimate_tokens(prompt))
+    return model.generate_content(prompt, **kwargs)
+
+
+def generate_content(model, prompt: str, **kwargs):
+    """
+    Run model.generate_content on the shared Gemini pool.
+    At most GEMINI_MAX_WORKERS calls are in flight across all requests;
+    the rest queue instead of bursting into 429 rate-limit errors.
+    Exceptions from the SDK are re-raised in the caller.
+    """
+    return _executor.submit(_throttled_generate, model, prompt, kwargs).result()
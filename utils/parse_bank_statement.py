@@ -3,10 +3,39 @@ Optimized Bank Statement Parser
 Extracts structured financial metrics locally - NO raw text to LLM
 """
 import re
-import pdfplumber
 from typing import Dict, List
 from datetime import datetime, timedelta
 
+from utils.pdf_text import read_pdf_text
+
+
+# Patterns are compiled once at import; the parser only runs them
+BALANCE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(?:balance|bal|available|closing)[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
+    r'[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:balance|bal|available)',
+    r'opening\s*balance[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
+    r'closing\s*balance[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
+)]
+
+CREDIT_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'credit[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
+    r'(?:salary|deposit|income|transfer\s*in)[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
+    r'[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:credit|cr)',
+)]
+
+DEBIT_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'debit[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
+    r'(?:payment|withdrawal|transfer\s*out|expense)[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
+    r'[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:debit|dr)',
+)]
+
+# Keyword checks - one case-insensitive scan each instead of lowercasing the text per keyword
+EMI_KEYWORD_RE = re.compile(r'emi|installment', re.IGNORECASE)
+LATE_FEE_KEYWORD_RE = re.compile(r'late|fee|charge', re.IGNORECASE)
+TRANSACTION_KEYWORD_RE = re.compile(r'transaction|debit|credit|payment|transfer', re.IGNORECASE)
+NEGATIVE_BALANCE_RE = re.compile(r'overdraft|negative|insufficient|od', re.IGNORECASE)
+DIGITAL_KEYWORD_RE = re.compile(r'upi|online|neft|imps|rtgs|net banking', re.IGNORECASE)
+
 
 def parse_bank_statement(pdf_path: str) -> Dict:
     """
@@ -14,29 +43,21 @@ def parse_bank_statement(pdf_path: str) -> Dict:
     Returns only key metrics - no raw text.
     """
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            tables_data = []
-            
-            for page in pdf.pages:
-                page_text = page.extract_text() or ""
-                text += page_text + "\n"
-                
-                # Try to extract tables (more accurate for transactions)
-                tables = page.extract_tables()
-                if tables:
-                    tables_data.extend(tables)
-        
+        text = read_pdf_text(pdf_path)
+    except Exception as e:
+        return _empty_bank_statement(str(e))
+    return parse_bank_statement_text(text)
+
+
+def parse_bank_statement_text(text: str) -> Dict:
+    """
+    Extract structured data from already-extracted bank statement text.
+    """
+    try:
         # Extract account balances
-        balance_patterns = [
-            r'(?:balance|bal|available|closing)[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
-            r'[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:balance|bal|available)',
-            r'opening\s*balance[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
-            r'closing\s*balance[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
-        ]
         balances = []
-        for pattern in balance_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
+        for pattern in BALANCE_PATTERNS:
+            matches = pattern.findall(text)
             for match in matches:
                 amount_str = match.replace(',', '')
                 try:
@@ -51,22 +72,18 @@ def parse_bank_statement(pdf_path: str) -> Dict:
         max_balance = max(balances) if balances else 0
         
         # Extract credits (income, salary, deposits)
-        credit_patterns = [
-            r'credit[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
-            r'(?:salary|deposit|income|transfer\s*in)[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
-            r'[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:credit|cr)',
-        ]
         credits = []
         salary_credits = []
-        for pattern in credit_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
+        for pattern in CREDIT_PATTERNS:
+            is_salary_pattern = 'salary' in pattern.pattern.lower()
+            matches = pattern.findall(text)
             for match in matches:
                 amount_str = match.replace(',', '')
                 try:
                     amount = float(amount_str)
                     credits.append(amount)
                     # Check if it's salary (typically larger, regular amounts)
-                    if 'salary' in pattern.lower() or amount > 10000:
+                    if is_salary_pattern or amount > 10000:
                         salary_credits.append(amount)
                 except:
                     pass
@@ -76,17 +93,14 @@ def parse_bank_statement(pdf_path: str) -> Dict:
         avg_monthly_income = total_salary_credits / max(len(salary_credits), 1) if salary_credits else None
         
         # Extract debits (expenses, payments, withdrawals)
-        debit_patterns = [
-            r'debit[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
-            r'(?:payment|withdrawal|transfer\s*out|expense)[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
-            r'[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:debit|dr)',
-        ]
+        has_emi = EMI_KEYWORD_RE.search(text) is not None
+        has_late_fee = LATE_FEE_KEYWORD_RE.search(text) is not None
         debits = []
         emi_payments = []
         late_fees = []
         
-        for pattern in debit_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
+        for pattern in DEBIT_PATTERNS:
+            matches = pattern.findall(text)
             for match in matches:
                 amount_str = match.replace(',', '')
                 try:
@@ -94,11 +108,11 @@ def parse_bank_statement(pdf_path: str) -> Dict:
                     debits.append(amount)
                     
                     # Check for EMI payments (regular, similar amounts)
-                    if 'emi' in text.lower() or 'installment' in text.lower():
+                    if has_emi:
                         emi_payments.append(amount)
                     
                     # Check for late fees/charges
-                    if 'late' in text.lower() or 'fee' in text.lower() or 'charge' in text.lower():
+                    if has_late_fee:
                         late_fees.append(amount)
                 except:
                     pass
@@ -111,18 +125,16 @@ def parse_bank_statement(pdf_path: str) -> Dict:
         savings_estimate = total_credits - total_debits
         
         # Extract transaction counts
-        transaction_keywords = ['transaction', 'debit', 'credit', 'payment', 'transfer']
-        transaction_count = sum(1 for keyword in transaction_keywords if keyword.lower() in text.lower())
+        transaction_count = len({match.lower() for match in TRANSACTION_KEYWORD_RE.findall(text)})
         
         # Check for negative balance/overdraft
-        negative_balance = any(word in text.lower() for word in ['overdraft', 'negative', 'insufficient', 'od'])
+        negative_balance = NEGATIVE_BALANCE_RE.search(text) is not None
         
         # Extract largest expense
         largest_expense = max(debits) if debits else 0
         
         # Estimate digital vs cash spend (if UPI/online keywords present)
-        digital_keywords = ['upi', 'online', 'neft', 'imps', 'rtgs', 'net banking']
-        digital_spend = sum(amount for amount in debits if any(kw in text.lower() for kw in digital_keywords))
+        digital_spend = total_debits if DIGITAL_KEYWORD_RE.search(text) else 0
         cash_spend = total_debits - digital_spend
         
         # Build structured JSON - ONLY key metrics
@@ -145,22 +157,26 @@ def parse_bank_statement(pdf_path: str) -> Dict:
         }
     
     except Exception as e:
-        return {
-            "error": str(e),
-            "total_income": 0,
-            "salary_credits": 0,
-            "avg_monthly_income": None,
-            "total_expenses": 0,
-            "emi_payments": 0,
-            "late_fees": 0,
-            "largest_expense": 0,
-            "savings_estimate": 0,
-            "digital_spend": 0,
-            "cash_spend": 0,
-            "avg_balance": 0,
-            "min_balance": 0,
-            "max_balance": 0,
-            "transaction_count": 0,
-            "negative_balance": False
-        }
+        return _empty_bank_statement(str(e))
+
 
+def _empty_bank_statement(error: str) -> Dict:
+    """Empty result returned when parsing fails"""
+    return {
+        "error": error,
+        "total_income": 0,
+        "salary_credits": 0,
+        "avg_monthly_income": None,
+        "total_expenses": 0,
+        "emi_payments": 0,
+        "late_fees": 0,
+        "largest_expense": 0,
+        "savings_estimate": 0,
+        "digital_spend": 0,
+        "cash_spend": 0,
+        "avg_balance": 0,
+        "min_balance": 0,
+        "max_balance": 0,
+        "transaction_count": 0,
+        "negative_balance": False
+    }
@@ -3,9 +3,45 @@ Optimized CIBIL/Credit Bureau Report Parser
 Extracts only key metrics locally - NO raw text to LLM
 """
 import re
-import pdfplumber
+from datetime import datetime
 from typing import Dict, Optional
 
+from utils.pdf_text import read_pdf_text
+
+
+# Patterns are compiled once at import; the parser only runs them
+SCORE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(?:CIBIL|credit\s*score|score)[\s:]*(\d{3})',
+    r'(\d{3})\s*(?:CIBIL|credit\s*score)',
+    r'score[\s:]*(\d{3})',
+)]
+
+LOAN_KEYWORDS = ['loan', 'credit card', 'mortgage', 'personal loan', 'home loan']
+LOAN_KEYWORD_PATTERNS = [re.compile(rf'\b{re.escape(keyword)}\b', re.IGNORECASE) for keyword in LOAN_KEYWORDS]
+
+LATE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(?:late|delayed|overdue|missed).*?payment',
+    r'payment.*?(?:late|delayed|overdue|missed)',
+    r'DPD\s*(\d+)',  # Days Past Due
+)]
+
+UTIL_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'utilization[\s:]*(\d+(?:\.\d+)?)\s*%',
+    r'(\d+(?:\.\d+)?)\s*%[\s]*utilization',
+    r'credit\s*utilization[\s:]*(\d+(?:\.\d+)?)',
+)]
+
+HISTORY_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(\d+)\s*(?:years?|yrs?)\s*(?:of\s*)?(?:credit\s*)?history',
+    r'history[\s:]*(\d+)\s*(?:years?|yrs?)',
+    r'since\s*(\d{4})',  # Account opened since year
+)]
+
+LIMIT_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(?:total\s*)?credit\s*limit[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d+)?)',
+    r'limit[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d+)?)',
+)]
+
 
 def parse_cibil_report(pdf_path: str) -> Dict:
     """
@@ -13,21 +49,21 @@ def parse_cibil_report(pdf_path: str) -> Dict:
     Returns only key metrics - no raw text.
     """
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                page_text = page.extract_text() or ""
-                text += page_text + "\n"
-        
+        text = read_pdf_text(pdf_path)
+    except Exception as e:
+        return _empty_cibil_report(str(e))
+    return parse_cibil_report_text(text)
+
+
+def parse_cibil_report_text(text: str) -> Dict:
+    """
+    Extract structured data from already-extracted CIBIL credit report text.
+    """
+    try:
         # Extract CIBIL score (typically 300-900)
-        score_patterns = [
-            r'(?:CIBIL|credit\s*score|score)[\s:]*(\d{3})',
-            r'(\d{3})\s*(?:CIBIL|credit\s*score)',
-            r'score[\s:]*(\d{3})',
-        ]
         cibil_score = None
-        for pattern in score_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in SCORE_PATTERNS:
+            match = pattern.search(text)
             if match:
                 score = int(match.group(1))
                 if 300 <= score <= 900:
@@ -35,32 +71,20 @@ def parse_cibil_report(pdf_path: str) -> Dict:
                     break
         
         # Extract open loans count
-        loan_keywords = ['loan', 'credit card', 'mortgage', 'personal loan', 'home loan']
         loan_count = 0
-        for keyword in loan_keywords:
-            matches = re.findall(rf'\b{re.escape(keyword)}\b', text, re.IGNORECASE)
-            loan_count += len(matches)
+        for pattern in LOAN_KEYWORD_PATTERNS:
+            loan_count += len(pattern.findall(text))
         
         # Extract late payments count
-        late_patterns = [
-            r'(?:late|delayed|overdue|missed).*?payment',
-            r'payment.*?(?:late|delayed|overdue|missed)',
-            r'DPD\s*(\d+)',  # Days Past Due
-        ]
         late_payments = 0
-        for pattern in late_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
+        for pattern in LATE_PATTERNS:
+            matches = pattern.findall(text)
             late_payments += len(matches)
         
         # Extract credit utilization percentage
-        util_patterns = [
-            r'utilization[\s:]*(\d+(?:\.\d+)?)\s*%',
-            r'(\d+(?:\.\d+)?)\s*%[\s]*utilization',
-            r'credit\s*utilization[\s:]*(\d+(?:\.\d+)?)',
-        ]
         credit_utilization = None
-        for pattern in util_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in UTIL_PATTERNS:
+            match = pattern.search(text)
             if match:
                 util = float(match.group(1))
                 if 0 <= util <= 100:
@@ -68,19 +92,13 @@ def parse_cibil_report(pdf_path: str) -> Dict:
                     break
         
         # Extract credit history length (look for dates or years mentioned)
-        history_patterns = [
-            r'(\d+)\s*(?:years?|yrs?)\s*(?:of\s*)?(?:credit\s*)?history',
-            r'history[\s:]*(\d+)\s*(?:years?|yrs?)',
-            r'since\s*(\d{4})',  # Account opened since year
-        ]
         credit_history_years = None
-        for pattern in history_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in HISTORY_PATTERNS:
+            match = pattern.search(text)
             if match:
-                if 'since' in pattern:
+                if 'since' in pattern.pattern:
                     # Calculate years from year mentioned
                     year = int(match.group(1))
-                    from datetime import datetime
                     current_year = datetime.now().year
                     credit_history_years = current_year - year
                 else:
@@ -88,13 +106,9 @@ def parse_cibil_report(pdf_path: str) -> Dict:
                 break
         
         # Extract total credit limit (if available)
-        limit_patterns = [
-            r'(?:total\s*)?credit\s*limit[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d+)?)',
-            r'limit[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d+)?)',
-        ]
         total_credit_limit = None
-        for pattern in limit_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in LIMIT_PATTERNS:
+            match = pattern.search(text)
             if match:
                 amount_str = match.group(1).replace(',', '')
                 total_credit_limit = float(amount_str)
@@ -111,13 +125,17 @@ def parse_cibil_report(pdf_path: str) -> Dict:
         }
     
     except Exception as e:
-        return {
-            "error": str(e),
-            "cibil_score": None,
-            "open_loans": 0,
-            "late_payments": 0,
-            "credit_utilization": None,
-            "credit_history_length_years": None,
-            "total_credit_limit": None
-        }
+        return _empty_cibil_report(str(e))
+
 
+def _empty_cibil_report(error: str) -> Dict:
+    """Empty result returned when parsing fails"""
+    return {
+        "error": error,
+        "cibil_score": None,
+        "open_loans": 0,
+        "late_payments": 0,
+        "credit_utilization": None,
+        "credit_history_length_years": None,
+        "total_credit_limit": None
+    }
@@ -0,0 +1,89 @@
+"""
+Verified Document Parsing Pool
+Parses the verified-score documents side by side in worker processes
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict
+
+from utils.parse_cibil_report import parse_cibil_report
+from utils.parse_bank_statement import parse_bank_statement
+from utils.parse_upi_statement import parse_upi_csv, parse_upi_pdf
+from utils.parse_salary_slip import parse_salary_slip
+
+
+# Worker processes for document parsing (1 = parse inline in the request thread)
+DOC_PARSE_WORKERS = int(os.environ.get("DOC_PARSE_WORKERS", "4"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def parse_document(kind: str, path: str) -> Dict:
+    """Parse one verified-score document ('cibil', 'bank', 'upi' or 'salary')"""
+    if kind == "cibil":
+        return parse_cibil_report(path)
+    if kind == "bank":
+        return parse_bank_statement(path)
+    if kind == "upi":
+        return parse_upi_csv(path) if path.lower().endswith(".csv") else parse_upi_pdf(path)
+    if kind == "salary":
+        return parse_salary_slip(path)
+    raise ValueError(f"Unknown document type: {kind}")
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: forking a threaded web server can copy held locks into the child.
+            # Each worker re-imports the main module once (~1s for app.py's imports) when the pool starts
+            _pool = ProcessPoolExecutor(max_workers=DOC_PARSE_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool(broken: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_documents(files: Dict[str, str]) -> Dict[str, object]:
+    """
+    Parse {kind: path} documents and return {kind: parsed dict or the exception raised}.
+    PDFium is not thread-safe, so documents are spread over worker processes rather than threads;
+    a single document is parsed inline since a pool round-trip would only add latency (inline
+    parses share utils.pdf_text's PDFium lock with the request threads).
+    A worker that dies (e.g. PDFium crashing on a malformed file) fails only this request.
+    """
+    results = {}
+    if DOC_PARSE_WORKERS <= 1 or len(files) <= 1:
+        for kind, path in files.items():
+            try:
+                results[kind] = parse_document(kind, path)
+            except Exception as e:
+                results[kind] = e
+        return results
+
+    pool = _get_pool()
+    try:
+        futures = {kind: pool.submit(parse_document, kind, path) for kind, path in files.items()}
+    except BrokenProcessPool as e:
+        _reset_pool(pool)
+        return {kind: e for kind in files}
+
+    for kind, future in futures.items():
+        try:
+            results[kind] = future.result()
+        except BrokenProcessPool as e:
+            _reset_pool(pool)
+            results[kind] = e
+        except Exception as e:
+            results[kind] = e
+    return results
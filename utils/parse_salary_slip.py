@@ -3,10 +3,46 @@ Optimized Salary Slip Parser
 Extracts structured salary data locally - NO raw text to LLM
 """
 import re
-import pdfplumber
 from typing import Dict, Optional
 from datetime import datetime
 
+from utils.pdf_text import iter_pdf_page_texts
+
+
+# Patterns are compiled once at import; the parser only runs them
+GROSS_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(?:gross|gross\s*salary|total\s*earnings)[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
+    r'[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:gross|gross\s*salary)',
+    r'gross[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
+)]
+
+NET_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(?:net|net\s*pay|take\s*home|total\s*payable)[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
+    r'[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:net|net\s*pay|take\s*home)',
+)]
+
+DEDUCTION_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(?:total\s*deductions?|deduction)[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
+    r'[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:deduction|deductions)',
+)]
+
+EMP_ID_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(?:employee\s*id|emp\s*id|id)[\s:]*([A-Z0-9]{4,})',
+    r'([A-Z]{2,}\d{4,})',  # Common pattern: AB1234
+)]
+
+NAME_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(?:employee\s*name|name)[\s:]*([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)',
+    r'([A-Z][a-z]+\s+[A-Z][a-z]+)',  # First Last
+)]
+
+MONTH_PATTERN = re.compile(r'(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\w*\s*\d{4}', re.IGNORECASE)
+
+DATE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(?:for\s*the\s*month\s*of|month)[\s:]*([A-Z][a-z]+)\s*(\d{4})',
+    r'(\d{1,2})[/-](\d{4})',  # MM/YYYY
+)]
+
 
 def parse_salary_slip(pdf_path: str) -> Dict:
     """
@@ -14,21 +50,30 @@ def parse_salary_slip(pdf_path: str) -> Dict:
     Returns only key metrics - no raw text.
     """
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                page_text = page.extract_text() or ""
-                text += page_text + "\n"
-        
+        # Pay details sit at the top of a slip - stop reading pages once they have all been seen
+        pages = []
+        remaining = [GROSS_PATTERNS, NET_PATTERNS, EMP_ID_PATTERNS]
+        # iter_pdf_page_texts falls back to pdfplumber for slips PDFium rejects
+        for page_text in iter_pdf_page_texts(pdf_path):
+            pages.append(page_text)
+            remaining = [patterns for patterns in remaining if not any(p.search(page_text) for p in patterns)]
+            if not remaining:
+                break
+        text = "\n".join(pages)
+    except Exception as e:
+        return _empty_salary_slip(str(e))
+    return parse_salary_slip_text(text)
+
+
+def parse_salary_slip_text(text: str) -> Dict:
+    """
+    Extract structured data from already-extracted salary slip text.
+    """
+    try:
         # Extract gross salary
-        gross_patterns = [
-            r'(?:gross|gross\s*salary|total\s*earnings)[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
-            r'[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:gross|gross\s*salary)',
-            r'gross[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
-        ]
         gross_salary = None
-        for pattern in gross_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in GROSS_PATTERNS:
+            match = pattern.search(text)
             if match:
                 amount_str = match.group(1).replace(',', '')
                 try:
@@ -40,13 +85,9 @@ def parse_salary_slip(pdf_path: str) -> Dict:
                     pass
         
         # Extract net salary
-        net_patterns = [
-            r'(?:net|net\s*pay|take\s*home|total\s*payable)[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
-            r'[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:net|net\s*pay|take\s*home)',
-        ]
         net_salary = None
-        for pattern in net_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in NET_PATTERNS:
+            match = pattern.search(text)
             if match:
                 amount_str = match.group(1).replace(',', '')
                 try:
@@ -58,13 +99,9 @@ def parse_salary_slip(pdf_path: str) -> Dict:
                     pass
         
         # Extract total deductions
-        deduction_patterns = [
-            r'(?:total\s*deductions?|deduction)[\s:]*[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)',
-            r'[₹Rs]?\s*(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:deduction|deductions)',
-        ]
         total_deductions = 0
-        for pattern in deduction_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
+        for pattern in DEDUCTION_PATTERNS:
+            matches = pattern.findall(text)
             for match in matches:
                 amount_str = match.replace(',', '')
                 try:
@@ -78,43 +115,30 @@ def parse_salary_slip(pdf_path: str) -> Dict:
             net_salary = gross_salary - total_deductions
         
         # Extract employee ID
-        emp_id_patterns = [
-            r'(?:employee\s*id|emp\s*id|id)[\s:]*([A-Z0-9]{4,})',
-            r'([A-Z]{2,}\d{4,})',  # Common pattern: AB1234
-        ]
         emp_id = None
-        for pattern in emp_id_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in EMP_ID_PATTERNS:
+            match = pattern.search(text)
             if match:
                 emp_id = match.group(1)
                 break
         
         # Extract employee name (optional)
-        name_patterns = [
-            r'(?:employee\s*name|name)[\s:]*([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)',
-            r'([A-Z][a-z]+\s+[A-Z][a-z]+)',  # First Last
-        ]
         emp_name = None
-        for pattern in name_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in NAME_PATTERNS:
+            match = pattern.search(text)
             if match:
                 emp_name = match.group(1)
                 break
         
         # Check for regular employment (monthly pattern, date present)
-        month_pattern = r'(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\w*\s*\d{4}'
-        months_found = len(re.findall(month_pattern, text, re.IGNORECASE))
+        months_found = len(MONTH_PATTERN.findall(text))
         is_regular = months_found > 0 and gross_salary is not None
         
         # Extract month/year of salary
-        date_patterns = [
-            r'(?:for\s*the\s*month\s*of|month)[\s:]*([A-Z][a-z]+)\s*(\d{4})',
-            r'(\d{1,2})[/-](\d{4})',  # MM/YYYY
-        ]
         salary_month = None
         salary_year = None
-        for pattern in date_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in DATE_PATTERNS:
+            match = pattern.search(text)
             if match:
                 if len(match.groups()) == 2:
                     salary_month = match.group(1)
@@ -134,15 +158,19 @@ def parse_salary_slip(pdf_path: str) -> Dict:
         }
     
     except Exception as e:
-        return {
-            "error": str(e),
-            "gross_salary": None,
-            "net_salary": None,
-            "total_deductions": 0,
-            "emp_id": None,
-            "emp_name": None,
-            "is_regular": False,
-            "salary_month": None,
-            "salary_year": None
-        }
+        return _empty_salary_slip(str(e))
+
 
+def _empty_salary_slip(error: str) -> Dict:
+    """Empty result returned when parsing fails"""
+    return {
+        "error": error,
+        "gross_salary": None,
+        "net_salary": None,
+        "total_deductions": 0,
+        "emp_id": None,
+        "emp_name": None,
+        "is_regular": False,
+        "salary_month": None,
+        "salary_year": None
+    }
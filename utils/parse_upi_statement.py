@@ -3,11 +3,66 @@ Optimized UPI Statement Parser (CSV and PDF)
 Extracts structured transaction data locally - NO raw text to LLM
 """
 import re
+import importlib.util
 import pandas as pd
-import pdfplumber
 from typing import Dict, List
 from collections import Counter
 
+from utils.pdf_text import read_pdf_text
+
+
+# pyarrow is optional: when installed, pandas uses its multithreaded CSV reader.
+# Columns still come back as regular NumPy dtypes, so parsing logic is unchanged.
+CSV_ENGINE = "pyarrow" if importlib.util.find_spec("pyarrow") else "c"
+
+
+# Patterns are compiled once at import; the parser only runs them
+AMOUNT_PATTERNS = [re.compile(pattern) for pattern in (
+    r'[₹Rs]?\s*(\d{1,3}(?:,\d{2,3})*(?:\.\d{2})?)',
+    r'(\d+\.\d{2})',  # Decimal amounts
+)]
+
+# Description keywords for CSV rows, matched case-insensitively as substrings
+BILL_DESC_PATTERN = "|".join(map(re.escape, ['bill', 'electricity', 'water', 'gas', 'phone', 'internet', 'recharge', 'mobile']))
+MERCHANT_DESC_PATTERN = "|".join(map(re.escape, ['merchant', 'store', 'shop', 'restaurant', 'food', 'grocery']))
+
+TXN_ID_PATTERN = re.compile(r'(?:ref|txn|upi)[\s:]*([A-Z0-9]{8,})', re.IGNORECASE)
+
+# Keyword checks - one case-insensitive scan each instead of lowercasing the text per keyword
+TRANSACTION_KEYWORD_RE = re.compile(r'upi|payment|transfer|debit|credit|successful', re.IGNORECASE)
+BILL_KEYWORD_RE = re.compile(r'bill|electricity|water|gas|phone|recharge|mobile|internet', re.IGNORECASE)
+
+# CSV column name keywords (flexible column matching)
+AMOUNT_COLUMN_KEYWORDS = ('amount', 'rupee', 'rs', 'value')
+DATE_COLUMN_KEYWORDS = ('date', 'time', 'timestamp')
+DESC_COLUMN_KEYWORDS = ('desc', 'note', 'remark', 'narration', 'merchant', 'to')
+TYPE_COLUMN_KEYWORDS = ('type', 'status', 'mode')
+
+MERCHANT_PATTERNS = [re.compile(pattern) for pattern in (
+    r'to\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)',
+    r'merchant[\s:]*([A-Z][a-z]+)',
+    r'paid\s+to\s+([A-Z][a-z]+)',
+)]
+
+
+def read_upi_csv(csv_path: str) -> pd.DataFrame:
+    """
+    Read a UPI CSV export with the fastest available pandas engine.
+    Every column is read as text - parsers convert only the columns they use.
+    csv_path may also be a binary file object (e.g. an upload stream).
+    """
+    return pd.read_csv(csv_path, engine=CSV_ENGINE, dtype=str)
+
+
+def lowercase_columns(df: pd.DataFrame) -> List[tuple]:
+    """(name, lowercased name) pairs, so each column name is lowercased once per parse"""
+    return [(col, col.lower()) for col in df.columns]
+
+
+def match_columns(columns: List[tuple], keywords: tuple) -> List[str]:
+    """Columns (from lowercase_columns) whose lowercased name contains any of the keywords"""
+    return [col for col, lowered in columns if any(kw in lowered for kw in keywords)]
+
 
 def parse_upi_csv(csv_path: str) -> Dict:
     """
@@ -15,58 +70,57 @@ def parse_upi_csv(csv_path: str) -> Dict:
     Returns only key metrics - no raw text.
     """
     try:
-        df = pd.read_csv(csv_path)
+        df = read_upi_csv(csv_path)
         
         # Find relevant columns (flexible column matching)
-        amount_cols = [col for col in df.columns if any(kw in col.lower() for kw in ['amount', 'rupee', 'rs', 'value'])]
-        date_cols = [col for col in df.columns if any(kw in col.lower() for kw in ['date', 'time', 'timestamp'])]
-        desc_cols = [col for col in df.columns if any(kw in col.lower() for kw in ['desc', 'note', 'remark', 'narration', 'merchant', 'to'])]
-        type_cols = [col for col in df.columns if any(kw in col.lower() for kw in ['type', 'status', 'mode'])]
+        columns = lowercase_columns(df)
+        amount_cols = match_columns(columns, AMOUNT_COLUMN_KEYWORDS)
+        date_cols = match_columns(columns, DATE_COLUMN_KEYWORDS)
+        desc_cols = match_columns(columns, DESC_COLUMN_KEYWORDS)
+        type_cols = match_columns(columns, TYPE_COLUMN_KEYWORDS)
         
         amount_col = amount_cols[0] if amount_cols else df.columns[1]
         date_col = date_cols[0] if date_cols else df.columns[0]
         desc_col = desc_cols[0] if desc_cols else (df.columns[2] if len(df.columns) > 2 else df.columns[0])
         
-        # Clean amount column
-        df[amount_col] = df[amount_col].astype(str).str.replace(r'[^\d.]', '', regex=True)
-        df[amount_col] = pd.to_numeric(df[amount_col], errors='coerce')
-        df = df.dropna(subset=[amount_col])
+        # Keep only the columns we use
+        raw_amounts = df[amount_col]
+        descriptions = df[desc_col]
+        dates = df[date_col]
+        del df
+        
+        # Clean amount column (only run the regex cleanup on values that are not already numeric)
+        amounts = pd.to_numeric(raw_amounts, errors='coerce')
+        unparsed = amounts.isna() & raw_amounts.notna()
+        if unparsed.any():
+            cleaned = raw_amounts[unparsed].str.replace(r'[^\d.]', '', regex=True)
+            amounts[unparsed] = pd.to_numeric(cleaned, errors='coerce')
+        valid = amounts.notna()
+        amounts = amounts[valid]
+        descriptions = descriptions[valid]
+        dates = dates[valid]
         
         # Calculate totals
-        total_transactions = len(df)
-        total_spend = df[amount_col].abs().sum()
+        total_transactions = len(amounts)
+        total_spend = amounts.abs().sum()
         avg_transaction = total_spend / total_transactions if total_transactions > 0 else 0
         
-        # Categorize transactions
-        bill_keywords = ['bill', 'electricity', 'water', 'gas', 'phone', 'internet', 'recharge', 'mobile']
-        merchant_keywords = ['merchant', 'store', 'shop', 'restaurant', 'food', 'grocery']
-        
-        bill_payments = 0
-        merchant_transactions = 0
-        merchant_categories = []
-        
-        if desc_col in df.columns:
-            for desc in df[desc_col].astype(str):
-                desc_lower = desc.lower()
-                if any(kw in desc_lower for kw in bill_keywords):
-                    bill_payments += 1
-                if any(kw in desc_lower for kw in merchant_keywords):
-                    merchant_transactions += 1
-                    # Extract merchant name (first few words)
-                    words = desc.split()[:3]
-                    merchant_categories.append(' '.join(words))
+        # Categorize transactions (vectorized; missing descriptions match nothing)
+        bill_payments = int(descriptions.str.contains(BILL_DESC_PATTERN, case=False, regex=True, na=False).sum())
+        merchant_mask = descriptions.str.contains(MERCHANT_DESC_PATTERN, case=False, regex=True, na=False)
+        
+        # Extract merchant name (first few words)
+        merchant_categories = descriptions[merchant_mask].str.split().str[:3].str.join(' ').tolist()
         
         # Calculate regularity (transactions per day)
         regularity = 0
-        if date_col in df.columns:
-            try:
-                df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
-                df = df.dropna(subset=[date_col])
-                if len(df) > 0:
-                    date_range = (df[date_col].max() - df[date_col].min()).days
-                    regularity = total_transactions / max(date_range, 1)
-            except:
-                regularity = total_transactions / 30  # Assume monthly
+        try:
+            dates = pd.to_datetime(dates, errors='coerce').dropna()
+            if len(dates) > 0:
+                date_range = (dates.max() - dates.min()).days
+                regularity = total_transactions / max(date_range, 1)
+        except:
+            regularity = total_transactions / 30  # Assume monthly
         
         # Count unique merchants
         unique_merchants = len(set(merchant_categories)) if merchant_categories else 0
@@ -87,17 +141,7 @@ def parse_upi_csv(csv_path: str) -> Dict:
         }
     
     except Exception as e:
-        return {
-            "error": str(e),
-            "upi_transaction_count": 0,
-            "upi_total_spend": 0,
-            "upi_bill_payments": 0,
-            "merchant_categories": [],
-            "digital_behavior_index": 0,
-            "avg_transaction_amount": 0,
-            "regularity_per_day": 0,
-            "unique_merchants": 0
-        }
+        return _empty_upi_result(str(e))
 
 
 def parse_upi_pdf(pdf_path: str) -> Dict:
@@ -106,20 +150,21 @@ def parse_upi_pdf(pdf_path: str) -> Dict:
     Returns only key metrics - no raw text.
     """
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                page_text = page.extract_text() or ""
-                text += page_text + "\n"
-        
+        text = read_pdf_text(pdf_path)
+    except Exception as e:
+        return _empty_upi_result(str(e))
+    return parse_upi_pdf_text(text)
+
+
+def parse_upi_pdf_text(text: str) -> Dict:
+    """
+    Extract structured data from already-extracted UPI statement text.
+    """
+    try:
         # Extract transaction amounts
-        amount_patterns = [
-            r'[₹Rs]?\s*(\d{1,3}(?:,\d{2,3})*(?:\.\d{2})?)',
-            r'(\d+\.\d{2})',  # Decimal amounts
-        ]
         amounts = []
-        for pattern in amount_patterns:
-            matches = re.findall(pattern, text)
+        for pattern in AMOUNT_PATTERNS:
+            matches = pattern.findall(text)
             for match in matches:
                 amount_str = match.replace(',', '')
                 try:
@@ -130,30 +175,22 @@ def parse_upi_pdf(pdf_path: str) -> Dict:
                     pass
         
         # Extract transaction IDs (UPI ref numbers)
-        txn_id_pattern = r'(?:ref|txn|upi)[\s:]*([A-Z0-9]{8,})'
-        txn_ids = re.findall(txn_id_pattern, text, re.IGNORECASE)
+        txn_ids = TXN_ID_PATTERN.findall(text)
         
         # Count transactions
-        transaction_keywords = ['upi', 'payment', 'transfer', 'debit', 'credit', 'successful']
-        transaction_count = sum(1 for keyword in transaction_keywords if keyword.lower() in text.lower())
+        transaction_count = len({match.lower() for match in TRANSACTION_KEYWORD_RE.findall(text)})
         transaction_count = max(transaction_count, len(amounts), len(txn_ids))
         
         total_spend = sum(amounts) if amounts else 0
         avg_transaction = total_spend / len(amounts) if amounts else 0
         
         # Categorize bill payments
-        bill_keywords = ['bill', 'electricity', 'water', 'gas', 'phone', 'recharge', 'mobile', 'internet']
-        bill_payments = sum(1 for keyword in bill_keywords if keyword.lower() in text.lower())
+        bill_payments = len({match.lower() for match in BILL_KEYWORD_RE.findall(text)})
         
         # Extract merchant names (look for common patterns)
-        merchant_patterns = [
-            r'to\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)',
-            r'merchant[\s:]*([A-Z][a-z]+)',
-            r'paid\s+to\s+([A-Z][a-z]+)',
-        ]
         merchants = []
-        for pattern in merchant_patterns:
-            matches = re.findall(pattern, text)
+        for pattern in MERCHANT_PATTERNS:
+            matches = pattern.findall(text)
             merchants.extend(matches)
         
         unique_merchants = len(set(merchants))
@@ -177,15 +214,19 @@ def parse_upi_pdf(pdf_path: str) -> Dict:
         }
     
     except Exception as e:
-        return {
-            "error": str(e),
-            "upi_transaction_count": 0,
-            "upi_total_spend": 0,
-            "upi_bill_payments": 0,
-            "merchant_categories": [],
-            "digital_behavior_index": 0,
-            "avg_transaction_amount": 0,
-            "regularity_per_day": 0,
-            "unique_merchants": 0
-        }
+        return _empty_upi_result(str(e))
+
 
+def _empty_upi_result(error: str) -> Dict:
+    """Empty result returned when parsing fails"""
+    return {
+        "error": error,
+        "upi_transaction_count": 0,
+        "upi_total_spend": 0,
+        "upi_bill_payments": 0,
+        "merchant_categories": [],
+        "digital_behavior_index": 0,
+        "avg_transaction_amount": 0,
+        "regularity_per_day": 0,
+        "unique_merchants": 0
+    }